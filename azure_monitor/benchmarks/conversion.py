@@ -0,0 +1,78 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+"""Measures the cost of converting spans to envelopes.
+
+Reports the conversion rate, and the memory blocks allocated and still
+held per envelope while the envelopes are kept, e.g. in the export queue.
+
+Usage: python benchmarks/conversion.py [span count]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from opentelemetry.trace import SpanKind
+
+from azure_monitor.export import _serialize_envelope
+from azure_monitor.export.trace import convert_span_to_envelope
+from envelopes import make_span
+
+
+def _allocations(function, count):
+    """Blocks and bytes allocated per call and kept, on average."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [function() for _ in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del kept
+    return blocks / count, size / count
+
+
+def main(count=2000, repeat=5):
+    print(
+        "{:<8} {:>14} {:>14} {:>14} {:>14}".format(
+            "kind", "convert/s", "serialize/s", "blocks/env", "bytes/env"
+        )
+    )
+    for kind in (SpanKind.CLIENT, SpanKind.SERVER):
+        spans = [make_span(kind) for _ in range(count)]
+        convert_time = min(
+            timeit.repeat(
+                lambda spans=spans: [
+                    convert_span_to_envelope(x) for x in spans
+                ],
+                number=1,
+                repeat=repeat,
+            )
+        )
+        envelopes = [convert_span_to_envelope(x) for x in spans]
+        serialize_time = min(
+            timeit.repeat(
+                lambda envelopes=envelopes: [
+                    _serialize_envelope(x) for x in envelopes
+                ],
+                number=1,
+                repeat=repeat,
+            )
+        )
+        span = spans[0]
+        blocks, size = _allocations(
+            lambda span=span: convert_span_to_envelope(span), count
+        )
+        print(
+            "{:<8} {:>14,.0f} {:>14,.0f} {:>14.1f} {:>14.0f}".format(
+                kind.name.lower(),
+                count / convert_time,
+                count / serialize_time,
+                blocks,
+                size,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,78 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+"""Representative telemetry shared by the benchmarks."""
+import random
+
+from opentelemetry.sdk.trace import Span
+from opentelemetry.trace import SpanContext, SpanKind
+
+from azure_monitor import protocol, utils
+from azure_monitor.export.trace import (
+    convert_span_to_envelope,
+    indicate_processed_by_metric_extractors,
+)
+
+INSTRUMENTATION_KEY = "1234abcd-5678-4efa-8abc-1234567890ab"
+
+
+def make_span(kind=SpanKind.CLIENT):
+    """Returns a finished HTTP span as produced by the requests integration."""
+    span = Span(
+        name="GET /api/orders",
+        context=SpanContext(
+            trace_id=random.getrandbits(128),
+            span_id=random.getrandbits(64),
+            is_remote=False,
+        ),
+        parent=SpanContext(
+            trace_id=random.getrandbits(128),
+            span_id=random.getrandbits(64),
+            is_remote=False,
+        ),
+        kind=kind,
+        attributes={
+            "component": "http",
+            "http.method": "GET",
+            "http.url": "https://orders.example.com/api/orders?page=2",
+            "http.route": "/api/orders",
+            "http.status_code": 200,
+            "customer.tier": "gold",
+        },
+    )
+    span.start()
+    span.end()
+    return span
+
+
+def make_span_envelopes(count):
+    envelopes = []
+    for index in range(count):
+        kind = SpanKind.SERVER if index % 2 else SpanKind.CLIENT
+        envelope = convert_span_to_envelope(make_span(kind))
+        envelope.ikey = INSTRUMENTATION_KEY
+        indicate_processed_by_metric_extractors(envelope)
+        envelopes.append(envelope)
+    return envelopes
+
+
+def make_metric_envelopes(count):
+    envelopes = []
+    for index in range(count):
+        envelope = protocol.Envelope(
+            ikey=INSTRUMENTATION_KEY,
+            tags=protocol.ContextTags(shared=utils.azure_monitor_context),
+            time="2020-09-24T10:00:00.000000Z",
+            name="Microsoft.ApplicationInsights.Metric",
+        )
+        data_point = protocol.DataPoint(
+            ns="requests",
+            name="requests_total",
+            value=float(index),
+            kind=protocol.DataPointType.MEASUREMENT.value,
+        )
+        data = protocol.MetricData(
+            metrics=[data_point], properties={"environment": "production"}
+        )
+        envelope.data = protocol.Data(base_data=data, base_type="MetricData")
+        envelopes.append(envelope)
+    return envelopes
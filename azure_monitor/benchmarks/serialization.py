@@ -0,0 +1,57 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+"""Compares the throughput of the available JSON backends.
+
+Usage: python benchmarks/serialization.py [batch size]
+"""
+import sys
+import timeit
+
+from azure_monitor import serialization
+from envelopes import make_metric_envelopes, make_span_envelopes
+
+
+def main(batch_size=512, repeat=5):
+    batches = {
+        "span": [x.to_dict() for x in make_span_envelopes(batch_size)],
+        "metric": [x.to_dict() for x in make_metric_envelopes(batch_size)],
+    }
+    print(
+        "{:<8} {:<8} {:>14} {:>14}".format(
+            "backend", "kind", "dumps env/s", "loads env/s"
+        )
+    )
+    for backend in serialization.available_backends():
+        serialization.set_backend(backend)
+        for kind, envelopes in batches.items():
+            encoded = [serialization.dumps(x) for x in envelopes]
+            dumps_time = min(
+                timeit.repeat(
+                    lambda envelopes=envelopes: [
+                        serialization.dumps(x) for x in envelopes
+                    ],
+                    number=1,
+                    repeat=repeat,
+                )
+            )
+            loads_time = min(
+                timeit.repeat(
+                    lambda encoded=encoded: [
+                        serialization.loads(x) for x in encoded
+                    ],
+                    number=1,
+                    repeat=repeat,
+                )
+            )
+            print(
+                "{:<8} {:<8} {:>14,.0f} {:>14,.0f}".format(
+                    backend,
+                    kind,
+                    batch_size / dumps_time,
+                    batch_size / loads_time,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
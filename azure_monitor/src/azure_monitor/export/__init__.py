@@ -1,8 +1,12 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
-import json
+import gzip
 import logging
+import threading
+import time
 import typing
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from urllib.parse import urlparse
 
@@ -12,10 +16,16 @@ from opentelemetry.sdk.trace.export import SpanExportResult
 from opentelemetry.sdk.util import ns_to_iso_str
 from opentelemetry.trace import Span, SpanKind
 from opentelemetry.trace.status import StatusCanonicalCode
+from requests.adapters import HTTPAdapter
 
-from azure_monitor import protocol, utils
+from azure_monitor import protocol, serialization, utils
+from azure_monitor.export.circuit_breaker import CircuitBreaker
+from azure_monitor.export.retry import RetryScheduler, parse_retry_after
+from azure_monitor.export.worker import ExportWorker
+from azure_monitor.memory_storage import MemoryStorage, NullStorage
 from azure_monitor.options import ExporterOptions
 from azure_monitor.protocol import Envelope
+from azure_monitor.segment_storage import SegmentFileStorage
 from azure_monitor.storage import LocalFileStorage
 
 logger = logging.getLogger(__name__)
@@ -27,6 +37,50 @@ class ExportResult(Enum):
     FAILED_NOT_RETRYABLE = 2
 
 
+class TransmissionStatistics:
+    """Running counters of the payloads sent to the ingestion service.
+
+    Attributes:
+        requests: Number of requests sent.
+        raw_bytes: Total size of the serialized payloads.
+        sent_bytes: Total size of the request bodies after compression.
+        last_raw_bytes: Serialized size of the most recent payload.
+        last_sent_bytes: Request body size of the most recent payload.
+        retried: Number of envelopes kept for retry, by status code.
+        dropped: Number of envelopes dropped, by status code.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.last_raw_bytes = 0
+        self.last_sent_bytes = 0
+        self.retried = {}
+        self.dropped = {}
+
+    def record_payload(self, raw_bytes: int, sent_bytes: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.raw_bytes += raw_bytes
+            self.sent_bytes += sent_bytes
+            self.last_raw_bytes = raw_bytes
+            self.last_sent_bytes = sent_bytes
+
+    def record_retry(self, status_code: int, count: int = 1) -> None:
+        with self._lock:
+            self.retried[status_code] = (
+                self.retried.get(status_code, 0) + count
+            )
+
+    def record_drop(self, status_code: int, count: int = 1) -> None:
+        with self._lock:
+            self.dropped[status_code] = (
+                self.dropped.get(status_code, 0) + count
+            )
+
+
 # pylint: disable=broad-except
 class BaseExporter:
     """Azure Monitor base exporter for OpenTelemetry.
@@ -38,13 +92,201 @@ class BaseExporter:
     def __init__(self, **options):
         self._telemetry_processors = []
         self.options = ExporterOptions(**options)
-        self.storage = LocalFileStorage(
+        self.storage = self._create_storage()
+        self._session = self._create_session()
+        self._session_lock = threading.Lock()
+        self._session_last_used = time.monotonic()
+        self.statistics = TransmissionStatistics()
+        self._retry = RetryScheduler(
+            initial_delay=self.options.retry_initial_delay,
+            max_delay=self.options.retry_max_delay,
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=self.options.circuit_breaker_threshold,
+            reset_timeout=self.options.circuit_breaker_reset_timeout,
+        )
+        self._worker = None
+        if self.options.async_export:
+            self._worker = ExportWorker(
+                function=self._export,
+                max_size=self.options.export_queue_size,
+                policy=self.options.export_queue_policy,
+                block_timeout=self.options.timeout,
+            )
+            self._worker.start()
+
+    def _create_storage(self):
+        """Creates the local storage selected by ``options.storage_type``."""
+        if self.options.storage_type == "memory":
+            return MemoryStorage(
+                max_size=self.options.storage_max_size,
+                retention_period=self.options.storage_retention_period,
+                eviction_policy=self.options.storage_eviction_policy,
+            )
+        if self.options.storage_type == "none":
+            return NullStorage()
+        if self.options.storage_type == "segment":
+            try:
+                return SegmentFileStorage(
+                    path=self.options.storage_path,
+                    max_size=self.options.storage_max_size,
+                    maintenance_period=self.options.storage_maintenance_period,
+                    retention_period=self.options.storage_retention_period,
+                    compress=self.options.storage_compression,
+                    eviction_policy=self.options.storage_eviction_policy,
+                )
+            except OSError:
+                # the directory is used by another process, e.g. another
+                # worker, the file storage can share it
+                logger.warning(
+                    "Local storage %s is owned by another process, falling "
+                    "back to file storage.",
+                    self.options.storage_path,
+                )
+        return LocalFileStorage(
             path=self.options.storage_path,
             max_size=self.options.storage_max_size,
             maintenance_period=self.options.storage_maintenance_period,
             retention_period=self.options.storage_retention_period,
+            compress=self.options.storage_compression,
+            eviction_policy=self.options.storage_eviction_policy,
+            exclusive=self.options.storage_exclusive,
+            commit_interval=self.options.storage_commit_interval,
+            commit_size=self.options.storage_commit_size,
+            durability=self.options.storage_durability,
         )
 
+    def _create_session(self) -> requests.Session:
+        """Creates the keep-alive session used to talk to ingestion.
+
+        A single host is targeted, so one pool per scheme is enough; the
+        pool size bounds the number of concurrent connections and always
+        leaves room for every concurrent storage replay.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max(
+                self.options.connection_pool_size,
+                self.options.storage_drain_concurrency,
+            ),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _evict_idle_connections(self) -> None:
+        """Drops pooled connections that have been idle for too long.
+
+        The ingestion front end may silently close idle connections, so
+        rather than paying for a failed request we start from a fresh pool.
+        The session itself stays usable and reconnects on demand.
+        """
+        idle_timeout = self.options.connection_idle_timeout
+        with self._session_lock:
+            now = time.monotonic()
+            if (
+                idle_timeout is not None
+                and now - self._session_last_used > idle_timeout
+            ):
+                self._session.close()
+            self._session_last_used = now
+
+    def _encode_payload(
+        self, envelopes: typing.List[bytes]
+    ) -> typing.Tuple[
+        typing.Union[bytes, typing.Iterator[bytes]], typing.Dict[str, str]
+    ]:
+        """Builds the request body and headers for serialized envelopes.
+
+        The body is compressed when compression is configured and the
+        payload is large enough for it to be worth the CPU time. With
+        ``options.chunked_upload`` the body is produced piece by piece while
+        it is being sent, so the whole payload is never held in memory.
+        """
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+        # envelopes, separating commas and enclosing brackets
+        size = sum(map(len, envelopes)) + len(envelopes) + 1
+        encoding = self.options.compression
+        if encoding and size >= self.options.compression_min_size:
+            headers["Content-Encoding"] = encoding
+        else:
+            encoding = None
+        if self.options.chunked_upload:
+            return self._stream_payload(envelopes, size, encoding), headers
+        body = b"[" + b",".join(envelopes) + b"]"
+        if encoding == "gzip":
+            body = gzip.compress(body, self.options.compression_level)
+        elif encoding == "deflate":
+            body = zlib.compress(body, self.options.compression_level)
+        self._record_payload(size, len(body))
+        return body, headers
+
+    def _stream_payload(
+        self, envelopes: typing.List[bytes], size: int, encoding: str = None
+    ) -> typing.Iterator[bytes]:
+        compressor = None
+        if encoding is not None:
+            # a window of 31 bits writes a gzip container, 15 a zlib one
+            compressor = zlib.compressobj(
+                self.options.compression_level,
+                zlib.DEFLATED,
+                31 if encoding == "gzip" else 15,
+            )
+        last = len(envelopes) - 1
+        sent = 0
+        for index, envelope in enumerate(envelopes):
+            chunk = (b"," if index else b"[") + envelope
+            if index == last:
+                chunk += b"]"
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+                if index == last:
+                    chunk += compressor.flush()
+            if chunk:
+                sent += len(chunk)
+                yield chunk
+        self._record_payload(size, sent)
+
+    def _record_payload(self, raw_bytes: int, sent_bytes: int) -> None:
+        self.statistics.record_payload(raw_bytes, sent_bytes)
+        logger.debug(
+            "Sent %d bytes (%d bytes uncompressed).", sent_bytes, raw_bytes
+        )
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every queued batch has been handled.
+
+        Returns False if the timeout elapsed first. Always True when
+        exporting synchronously.
+        """
+        if self._worker is None:
+            return True
+        return self._worker.flush(timeout)
+
+    def shutdown(self) -> None:
+        """Releases the pooled connections and stops local storage.
+
+        Batches still queued for asynchronous export get up to
+        ``options.timeout`` seconds to be sent, those left are kept in local
+        storage, as they would have been had they failed to be sent.
+        """
+        if self._worker is not None:
+            remaining = self._worker.stop(self.options.timeout)
+            if remaining:
+                logger.warning(
+                    "Storing %d batches not exported before shutdown.",
+                    len(remaining),
+                )
+            for envelopes in remaining:
+                for batch in self._split_batches(envelopes):
+                    self.storage.put(batch)
+        self._session.close()
+        self.storage.close()
+
     def add_telemetry_processor(
         self, processor: typing.Callable[..., any]
     ) -> None:
@@ -90,17 +332,247 @@ class BaseExporter:
                 filtered_envelopes.append(envelope)
         return filtered_envelopes
 
+    def _submit(self, envelopes: typing.List[Envelope]) -> ExportResult:
+        """Exports the envelopes, or queues them in asynchronous mode.
+
+        A batch that is accepted by the queue is reported as a success; a
+        batch rejected by a full queue is dropped and reported as a failure.
+        """
+        if self._worker is None:
+            return self._export(envelopes)
+        if self._worker.put(envelopes):
+            return ExportResult.SUCCESS
+        return ExportResult.FAILED_NOT_RETRYABLE
+
+    def _export(self, envelopes: typing.List[Envelope]) -> ExportResult:
+        result = ExportResult.SUCCESS
+        for batch in self._split_batches(envelopes):
+            if self._is_suspended():
+                batch_result = ExportResult.FAILED_RETRYABLE
+            else:
+                batch_result = self._transmit(batch)
+            if batch_result == ExportResult.FAILED_RETRYABLE:
+                # not to be replayed before the retry delay is over
+                self.storage.put(batch, lease_period=self._retry_lease())
+            if batch_result != ExportResult.SUCCESS:
+                result = batch_result
+        if result == ExportResult.SUCCESS:
+            # Try to send any cached events
+            self._transmit_from_storage()
+        return result
+
     def _transmit_from_storage(self) -> None:
-        for blob in self.storage.gets():
-            # give a few more seconds for blob lease operation
-            # to reduce the chance of race (for perf consideration)
-            if blob.lease(self.options.timeout + 5):
-                envelopes = blob.get()
-                result = self._transmit(envelopes)
-                if result == ExportResult.FAILED_RETRYABLE:
-                    blob.lease(1)
-                else:
+        """Replays the batches kept in local storage.
+
+        Up to ``options.storage_drain_concurrency`` blobs are sent at once.
+        The replay stops dispatching new blobs as soon as failures put the
+        exporter in back off or open the circuit breaker, the remaining
+        blobs are left for a later pass. When the storage owns its
+        directory, blobs are leased in memory and sent in groups, as many
+        as fit in a single request.
+        """
+        blobs = self.storage.gets()
+        transmit = self._transmit_blob
+        if getattr(self.storage, "exclusive", False):
+            blobs = self._group_blobs(blobs)
+            transmit = self._transmit_group
+        try:
+            self._replay(blobs, transmit)
+        finally:
+            blobs.close()  # gives back the blobs leased but not sent
+
+    def _replay(
+        self,
+        blobs: typing.Iterable[typing.Any],
+        transmit: typing.Callable[[typing.Any], None],
+    ) -> None:
+        concurrency = self.options.storage_drain_concurrency
+        if concurrency <= 1:
+            for blob in blobs:
+                if self._is_suspended():
+                    break
+                transmit(blob)
+            return
+        in_flight = threading.BoundedSemaphore(concurrency)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for blob in blobs:
+                in_flight.acquire()
+                if self._is_suspended():
+                    in_flight.release()
+                    break
+                future = executor.submit(transmit, blob)
+                future.add_done_callback(
+                    lambda future: self._replayed(future, in_flight)
+                )
+
+    @staticmethod
+    def _replayed(future, in_flight: threading.BoundedSemaphore) -> None:
+        """Logs what a concurrent replay raised, as the caller cannot."""
+        in_flight.release()
+        exception = future.exception()
+        if exception is not None:
+            logger.error(
+                "Exception occurred while replaying local storage.",
+                exc_info=exception,
+            )
+
+    def _group_blobs(
+        self, blobs: typing.Iterable[typing.Any]
+    ) -> typing.Iterator[typing.Tuple[list, list]]:
+        """Leases stored blobs and groups them to be sent together.
+
+        A group holds as many consecutive blobs as fit in a single request,
+        along with their serialized envelopes; a blob that does not fit in
+        a single request makes a group on its own.
+        """
+        group = []
+        envelopes = []
+        size = 2  # enclosing brackets
+        try:
+            for blob in blobs:
+                if self._is_suspended():
+                    break
+                if not blob.lease(self.options.timeout + 5):
+                    continue
+                items = blob.get_raw() or ()
+                items_size = sum(len(item) + 1 for item in items)
+                if group and (
+                    len(envelopes) + len(items) > self.options.max_batch_items
+                    or size + items_size > self.options.max_batch_size
+                ):
+                    full = (group, envelopes)
+                    group = [blob]
+                    envelopes = list(items)
+                    size = 2 + items_size
+                    try:
+                        yield full
+                    except GeneratorExit:
+                        # the replay stopped before sending the group
+                        group.extend(full[0])
+                        raise
+                    continue
+                group.append(blob)
+                envelopes.extend(items)
+                size += items_size
+            if group:
+                yield group, envelopes
+                group = []
+        finally:
+            # give back the blobs that were leased but not sent, along with
+            # the locks taken by their leases
+            for blob in group:
+                blob.lease(0)
+                blob.close()
+
+    def _transmit_blob(self, blob) -> None:
+        """Sends a stored blob, a batch at a time as it is read.
+
+        The blob is retried as a whole if none of its batches could be
+        sent, otherwise only the batches that failed are stored again.
+        """
+        # give a few more seconds for blob lease operation
+        # to reduce the chance of race (for perf consideration)
+        if not blob.lease(self.options.timeout + 5):
+            return
+        envelopes = blob.iter_raw()
+        try:
+            self._send_blobs([blob], envelopes)
+        finally:
+            envelopes.close()
+            blob.close()
+
+    def _transmit_group(self, group: typing.Tuple[list, list]) -> None:
+        """Sends a group of leased blobs made by ``_group_blobs``."""
+        blobs, envelopes = group
+        try:
+            self._send_blobs(blobs, envelopes)
+        finally:
+            for blob in blobs:
+                blob.close()
+
+    def _send_blobs(
+        self, blobs: typing.List[typing.Any], envelopes: typing.Iterable[bytes]
+    ) -> None:
+        # stored envelopes are already serialized, they are sent as they
+        # are instead of being decoded and encoded again
+        batches = self._split_batches(envelopes)
+        failed = []
+        consumed = False
+        for batch in batches:
+            if self._is_suspended() and not consumed:
+                break
+            if (
+                self._is_suspended()
+                or self._transmit(batch) == ExportResult.FAILED_RETRYABLE
+            ):
+                failed.append(batch)
+            else:
+                consumed = True
+        else:
+            if consumed or not failed:
+                # only keep the parts of the blob that still need sending
+                for batch in failed:
+                    self.storage.put(batch, lease_period=self._retry_lease())
+                for blob in blobs:
                     blob.delete()
+                return
+        # release the files of the blobs before leasing them again
+        batches.close()
+        if hasattr(envelopes, "close"):
+            envelopes.close()
+        for blob in blobs:
+            blob.lease(self._retry_lease())
+
+    def _is_suspended(self) -> bool:
+        """Whether ingestion should not be contacted for now."""
+        return self._retry.is_backing_off() or self.circuit_breaker.is_open()
+
+    def _retry_lease(self) -> float:
+        """Lease period for batches that failed and have to be retried."""
+        return max(self._retry.remaining(), 1)
+
+    def _backoff(self, response: requests.Response = None) -> None:
+        retry_after = None
+        if response is not None:
+            try:
+                retry_after = parse_retry_after(
+                    response.headers.get("Retry-After")
+                )
+            except Exception:
+                pass  # fall back to exponential back off
+        self.circuit_breaker.record_failure()
+        delay = self._retry.backoff(retry_after)
+        logger.warning(
+            "Backing off ingestion for %.1f seconds after %d failures.",
+            delay,
+            self._retry.failures,
+        )
+
+    def _split_batches(
+        self, envelopes: typing.Iterable[typing.Any]
+    ) -> typing.Iterator[typing.List[bytes]]:
+        """Splits envelopes into batches that fit in a single request.
+
+        Every envelope is serialized once here, the resulting batches hold
+        the serialized envelopes so they can be sent or stored as they are.
+        A batch is bounded by ``options.max_batch_items`` envelopes and
+        ``options.max_batch_size`` bytes of JSON array.
+        """
+        batch = []
+        size = 2  # enclosing brackets
+        for envelope in envelopes:
+            item = _serialize_envelope(envelope)
+            if batch and (
+                len(batch) >= self.options.max_batch_items
+                or size + len(item) > self.options.max_batch_size
+            ):
+                yield batch
+                batch = []
+                size = 2
+            batch.append(item)
+            size += len(item) + 1  # separating comma
+        if batch:
+            yield batch
 
     # pylint: disable=too-many-branches
     # pylint: disable=too-many-nested-blocks
@@ -109,18 +581,24 @@ class BaseExporter:
         """
         Transmit the data envelopes to the ingestion service.
 
+        The envelopes are sent in a single request, they can be given
+        either as dictionaries or already serialized.
+
         Returns an ExportResult, this function should never
         throw an exception.
         """
         if len(envelopes) > 0:
+            if not self.circuit_breaker.allow_request():
+                return ExportResult.FAILED_RETRYABLE
             try:
-                response = requests.post(
+                # kept to store the envelopes that partially failed as is
+                envelopes = [_serialize_envelope(x) for x in envelopes]
+                data, headers = self._encode_payload(envelopes)
+                self._evict_idle_connections()
+                response = self._session.post(
                     url=self.options.endpoint,
-                    data=json.dumps(envelopes),
-                    headers={
-                        "Accept": "application/json",
-                        "Content-Type": "application/json; charset=utf-8",
-                    },
+                    data=data,
+                    headers=headers,
                     timeout=self.options.timeout,
                     proxies=self.options.proxies,
                 )
@@ -128,12 +606,14 @@ class BaseExporter:
                 logger.warning(
                     "Request time out. Ingestion may be backed up. Retrying."
                 )
+                self._backoff()
                 return ExportResult.FAILED_RETRYABLE
             except Exception as ex:
                 logger.warning(
                     "Retrying due to transient client side error %s.", ex
                 )
                 # client side error (retryable)
+                self._backoff()
                 return ExportResult.FAILED_RETRYABLE
 
             text = "N/A"
@@ -144,15 +624,25 @@ class BaseExporter:
                 logger.warning("Error while reading response body %s.", ex)
             else:
                 try:
-                    data = json.loads(text)
+                    data = serialization.loads(text)
                 except Exception:
                     pass
 
+            if response.status_code in (
+                429,  # Too Many Requests
+                439,  # Too Many Requests over extended time
+                500,  # Internal Server Error
+                503,  # Service Unavailable
+            ):
+                self._backoff(response)
+            else:
+                # ingestion is reachable, even if it rejected the data
+                self._retry.reset()
+                self.circuit_breaker.record_success()
             if response.status_code == 200:
                 logger.info("Transmission succeeded: %s.", text)
                 return ExportResult.SUCCESS
             if response.status_code == 206:  # Partial Content
-                # TODO: store the unsent data
                 if data:
                     try:
                         resend_envelopes = []
@@ -166,6 +656,9 @@ class BaseExporter:
                                 resend_envelopes.append(
                                     envelopes[error["index"]]
                                 )
+                                self.statistics.record_retry(
+                                    error["statusCode"]
+                                )
                             else:
                                 logger.error(
                                     "Data drop %s: %s %s.",
@@ -173,6 +666,9 @@ class BaseExporter:
                                     error["message"],
                                     envelopes[error["index"]],
                                 )
+                                self.statistics.record_drop(
+                                    error["statusCode"]
+                                )
                         if resend_envelopes:
                             self.storage.put(resend_envelopes)
                     except Exception as ex:
@@ -192,13 +688,27 @@ class BaseExporter:
                 500,  # Internal Server Error
                 503,  # Service Unavailable
             ):
+                self.statistics.record_retry(
+                    response.status_code, len(envelopes)
+                )
                 return ExportResult.FAILED_RETRYABLE
 
+            self.statistics.record_drop(response.status_code, len(envelopes))
             return ExportResult.FAILED_NOT_RETRYABLE
         # No spans to export
         return ExportResult.SUCCESS
 
 
+def _serialize_envelope(envelope: typing.Any) -> bytes:
+    """Serializes an envelope given as an Envelope, a dict or bytes."""
+    if isinstance(envelope, bytes):
+        return envelope
+    if isinstance(envelope, Envelope):
+        # the dict only lives until it has been encoded
+        envelope = envelope.to_dict()
+    return serialization.dumps(envelope)
+
+
 def get_trace_export_result(result: ExportResult) -> SpanExportResult:
     if result == ExportResult.SUCCESS:
         return SpanExportResult.SUCCESS
@@ -0,0 +1,87 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops requests to an endpoint that keeps failing.
+
+    The breaker opens after a number of consecutive failures. While open,
+    no request is allowed. Once the reset timeout has elapsed it is half
+    open and lets a single probe request through: a success closes the
+    breaker, a failure opens it again.
+
+    Args:
+        failure_threshold: Consecutive failures that open the breaker.
+        reset_timeout: Seconds the breaker stays open before probing.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half_open"."""
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def is_open(self) -> bool:
+        """Whether a request would be rejected right now."""
+        with self._lock:
+            state = self._state()
+            return state == OPEN or (state == HALF_OPEN and self._probing)
+
+    def allow_request(self) -> bool:
+        """Whether a request may be sent, claims the probe if half open."""
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Ingestion is reachable again, closing circuit.")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (
+                self._opened_at is None
+                and self._failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    "Opening circuit to ingestion for %s seconds after %d "
+                    "consecutive failures.",
+                    self.reset_timeout,
+                    self._failures,
+                )
+                self._opened_at = time.monotonic()
+                self._probing = False
@@ -46,20 +46,10 @@ class AzureMonitorMetricsExporter(BaseExporter, MetricsExporter):
         self, metric_records: Sequence[MetricRecord]
     ) -> MetricsExportResult:
         envelopes = list(map(self._metric_to_envelope, metric_records))
-        envelopes = list(
-            map(
-                lambda x: x.to_dict(),
-                self._apply_telemetry_processors(envelopes),
-            )
-        )
+        # converted to dicts one at a time when serialized for sending
+        envelopes = self._apply_telemetry_processors(envelopes)
         try:
-            result = self._transmit(envelopes)
-            if result == ExportResult.FAILED_RETRYABLE:
-                self.storage.put(envelopes, result)
-            if result == ExportResult.SUCCESS:
-                # Try to send any cached events
-                self._transmit_from_storage()
-            return get_metrics_export_result(result)
+            return get_metrics_export_result(self._submit(envelopes))
         except Exception:  # pylint: disable=broad-except
             logger.exception("Exception occurred while exporting the data.")
             return get_metrics_export_result(ExportResult.FAILED_NOT_RETRYABLE)
@@ -72,7 +62,7 @@ class AzureMonitorMetricsExporter(BaseExporter, MetricsExporter):
             return None
         envelope = protocol.Envelope(
             ikey=self.options.instrumentation_key,
-            tags=dict(utils.azure_monitor_context),
+            tags=protocol.ContextTags(shared=utils.azure_monitor_context),
             time=ns_to_iso_str(metric_record.aggregator.last_update_timestamp),
         )
         envelope.name = "Microsoft.ApplicationInsights.Metric"
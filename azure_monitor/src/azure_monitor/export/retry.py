@@ -0,0 +1,94 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+import datetime
+import email.utils
+import random
+import threading
+import time
+
+
+class RetryScheduler:
+    """Decides how long an exporter waits before contacting ingestion again.
+
+    Consecutive failures double the delay, up to a cap. Half of each delay
+    is randomized so that a fleet of exporters that failed together does
+    not retry together. A delay requested by the service through the
+    Retry-After header takes precedence.
+
+    Args:
+        initial_delay: Delay in seconds after the first failure.
+        max_delay: Upper bound in seconds of the computed delay.
+    """
+
+    def __init__(self, initial_delay: float = 1.0, max_delay: float = 300.0):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+
+    @property
+    def failures(self) -> int:
+        """Number of consecutive failures."""
+        return self._failures
+
+    def backoff(self, retry_after: float = None) -> float:
+        """Records a failure, returns the number of seconds to wait.
+
+        Failures of requests that were already in flight when the back off
+        started belong to the same outage, they do not lengthen the delay
+        again; only a longer Retry-After does.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._retry_at:
+                if retry_after is not None:
+                    self._retry_at = max(self._retry_at, now + retry_after)
+                return self._retry_at - now
+            self._failures += 1
+            if retry_after is not None:
+                delay = retry_after
+            else:
+                delay = min(
+                    self.initial_delay * 2 ** (self._failures - 1),
+                    self.max_delay,
+                )
+                delay = delay / 2 + random.uniform(0, delay / 2)
+            self._retry_at = now + delay
+            return delay
+
+    def reset(self) -> None:
+        """Records a success."""
+        with self._lock:
+            self._failures = 0
+            self._retry_at = 0.0
+
+    def remaining(self) -> float:
+        """Seconds left before ingestion may be contacted again."""
+        return max(self._retry_at - time.monotonic(), 0.0)
+
+    def is_backing_off(self) -> bool:
+        return self.remaining() > 0
+
+
+def parse_retry_after(value: str) -> float:
+    """Parses a Retry-After header given in seconds or as an HTTP date.
+
+    Returns None if the value cannot be understood.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None:
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max((date - now).total_seconds(), 0.0)
@@ -1,5 +1,6 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
+import functools
 import json
 import logging
 from typing import Sequence
@@ -33,20 +34,10 @@ class AzureMonitorSpanExporter(BaseExporter, SpanExporter):
 
     def export(self, spans: Sequence[Span]) -> SpanExportResult:
         envelopes = list(map(self._span_to_envelope, spans))
-        envelopes = list(
-            map(
-                lambda x: x.to_dict(),
-                self._apply_telemetry_processors(envelopes),
-            )
-        )
+        # converted to dicts one at a time when serialized for sending
+        envelopes = self._apply_telemetry_processors(envelopes)
         try:
-            result = self._transmit(envelopes)
-            if result == ExportResult.FAILED_RETRYABLE:
-                self.storage.put(envelopes, result)
-            if result == ExportResult.SUCCESS:
-                # Try to send any cached events
-                self._transmit_from_storage()
-            return get_trace_export_result(result)
+            return get_trace_export_result(self._submit(envelopes))
         except Exception:  # pylint: disable=broad-except
             logger.exception("Exception occurred while exporting the data.")
             return get_trace_export_result(ExportResult.FAILED_NOT_RETRYABLE)
@@ -61,24 +52,203 @@ class AzureMonitorSpanExporter(BaseExporter, SpanExporter):
         return envelope
 
 
-# pylint: disable=too-many-statements
-# pylint: disable=too-many-branches
+class _AttributeMapping:
+    """Maps span attributes to the fields of an envelope.
+
+    The mapping is a table of rules, each registered with the attributes
+    it requires and those it optionally reads. Converting a span goes once
+    over its attributes: the ones read by a rule are gathered, the others
+    become custom properties unless they start with a skipped prefix. The
+    rules whose required attributes are all present then run in the order
+    they were registered.
+    """
+
+    def __init__(self, skipped_prefixes=()):
+        self.skipped_prefixes = tuple(skipped_prefixes)
+        self.rules = []
+        # every attribute read by a rule
+        self.keys = frozenset()
+
+    def rule(self, *required, optional=()):
+        """Registers the decorated function as a rule.
+
+        The function is called with the envelope, its data and the
+        gathered attributes.
+        """
+
+        def register(function):
+            self.rules.append((required, function))
+            self.keys = self.keys.union(required, optional)
+            return function
+
+        return register
+
+    def apply(self, envelope, data, attributes):
+        found = {}
+        properties = data.properties
+        for key, value in attributes.items():
+            if key in self.keys:
+                found[key] = value
+            if not key.startswith(self.skipped_prefixes):
+                properties[key] = value
+        if not found:
+            return
+        for required, function in self.rules:
+            if all(key in found for key in required):
+                function(envelope, data, found)
+
+
+# http attributes only end up in fields, they are redundant as properties
+_REQUEST_MAPPING = _AttributeMapping(skipped_prefixes=("http.",))
+_DEPENDENCY_MAPPING = _AttributeMapping(skipped_prefixes=("http.",))
+_INTERNAL_MAPPING = _AttributeMapping(skipped_prefixes=("http.",))
+
+
+# the rules take the same arguments, not all of them use every one
+# pylint: disable=unused-argument
+@_REQUEST_MAPPING.rule("http.method", optional=("http.route", "http.path"))
+def _request_name(envelope, data, attributes):
+    data.name = attributes["http.method"]
+    if "http.route" in attributes:
+        data.name = data.name + " " + attributes["http.route"]
+        envelope.tags["ai.operation.name"] = data.name
+        data.properties["request.name"] = data.name
+    elif "http.path" in attributes:
+        data.properties["request.name"] = (
+            data.name + " " + attributes["http.path"]
+        )
+
+
+@_REQUEST_MAPPING.rule("http.url")
+def _request_url(envelope, data, attributes):
+    data.url = attributes["http.url"]
+    data.properties["request.url"] = attributes["http.url"]
+
+
+@_REQUEST_MAPPING.rule("http.status_code")
+def _request_status(envelope, data, attributes):
+    status_code = attributes["http.status_code"]
+    data.response_code = str(status_code)
+    data.success = 200 <= status_code < 400
+
+
+@_DEPENDENCY_MAPPING.rule("component")
+def _dependency_component(envelope, data, attributes):
+    if attributes["component"] == "http":
+        data.type = "HTTP"
+
+
+@_DEPENDENCY_MAPPING.rule("http.url", optional=("http.method",))
+def _dependency_url(envelope, data, attributes):
+    url = attributes["http.url"]
+    # data is the url
+    data.data = url
+    target, name = _http_dependency(attributes.get("http.method"), url)
+    data.target = target
+    if name is not None:
+        data.name = name
+
+
+def _parse_http_dependency(method, url):
+    """Target and name of an HTTP dependency."""
+    parse_url = urlparse(url)
+    # TODO: error handling, probably put scheme as well
+    # target matches authority (host:port)
+    target = parse_url.netloc
+    if method is None:
+        return target, None
+    # name is METHOD/path
+    return target, method + "/" + parse_url.path
+
+
+# the same few endpoints tend to be called over and over
+_http_dependency = functools.lru_cache(maxsize=1024)(_parse_http_dependency)
+
+
+def dependency_cache_info():
+    """Hits, misses, maximum and current size of the HTTP dependency cache.
+
+    The cache maps the method and url of client spans to the target and
+    name of their dependency.
+    """
+    return _http_dependency.cache_info()
+
+
+def set_dependency_cache_size(size: int) -> None:
+    """Resizes the HTTP dependency cache, emptying it.
+
+    A size of 0 disables the cache, None lets it grow without bound.
+    """
+    # pylint: disable=global-statement
+    global _http_dependency
+    _http_dependency = functools.lru_cache(maxsize=size)(
+        _parse_http_dependency
+    )
+
+
+@_DEPENDENCY_MAPPING.rule("http.status_code")
+def _dependency_status(envelope, data, attributes):
+    status_code = attributes["http.status_code"]
+    data.result_code = str(status_code)
+    data.success = 200 <= status_code < 400
+
+
+def _peer(attributes):
+    """Address of the remote peer, host[:port]."""
+    if "net.peer.name" not in attributes:
+        return None
+    if "net.peer.port" in attributes:
+        return "{}:{}".format(
+            attributes["net.peer.name"], attributes["net.peer.port"]
+        )
+    return attributes["net.peer.name"]
+
+
+@_DEPENDENCY_MAPPING.rule(
+    "db.system",
+    optional=("db.name", "db.statement", "net.peer.name", "net.peer.port"),
+)
+def _dependency_db(envelope, data, attributes):
+    data.type = attributes["db.system"]
+    data.target = _peer(attributes) or attributes.get("db.name")
+    if "db.statement" in attributes:
+        data.data = attributes["db.statement"]
+
+
+@_DEPENDENCY_MAPPING.rule(
+    "messaging.system",
+    optional=("messaging.destination", "net.peer.name", "net.peer.port"),
+)
+def _dependency_messaging(envelope, data, attributes):
+    data.type = attributes["messaging.system"]
+    data.target = attributes.get("messaging.destination") or _peer(attributes)
+
+
+@_DEPENDENCY_MAPPING.rule(
+    "rpc.system",
+    optional=("rpc.service", "rpc.method", "net.peer.name", "net.peer.port"),
+)
+def _dependency_rpc(envelope, data, attributes):
+    data.type = attributes["rpc.system"]
+    data.target = _peer(attributes) or attributes.get("rpc.service")
+    if "rpc.service" in attributes and "rpc.method" in attributes:
+        data.name = attributes["rpc.service"] + "/" + attributes["rpc.method"]
+
+
 def convert_span_to_envelope(span: Span) -> protocol.Envelope:
     if not span:
         return None
-    envelope = protocol.Envelope(
-        ikey="",
-        tags=dict(utils.azure_monitor_context),
-        time=ns_to_iso_str(span.start_time),
-    )
-    envelope.tags["ai.operation.id"] = "{:032x}".format(span.context.trace_id)
+    tags = {"ai.operation.id": format(span.context.trace_id, "032x")}
     parent = span.parent
     if isinstance(parent, Span):
         parent = parent.context
     if parent:
-        envelope.tags["ai.operation.parentId"] = "{:016x}".format(
-            parent.span_id
-        )
+        tags["ai.operation.parentId"] = format(parent.span_id, "016x")
+    envelope = protocol.Envelope(
+        ikey="",
+        tags=protocol.ContextTags(tags, utils.azure_monitor_context),
+        time=ns_to_iso_str(span.start_time),
+    )
     if span.kind in (SpanKind.CONSUMER, SpanKind.SERVER):
         envelope.name = "Microsoft.ApplicationInsights.Request"
         data = protocol.Request(
@@ -90,23 +260,7 @@ def convert_span_to_envelope(span: Span) -> protocol.Envelope:
             properties={},
         )
         envelope.data = protocol.Data(base_data=data, base_type="RequestData")
-        if "http.method" in span.attributes:
-            data.name = span.attributes["http.method"]
-            if "http.route" in span.attributes:
-                data.name = data.name + " " + span.attributes["http.route"]
-                envelope.tags["ai.operation.name"] = data.name
-                data.properties["request.name"] = data.name
-            elif "http.path" in span.attributes:
-                data.properties["request.name"] = (
-                    data.name + " " + span.attributes["http.path"]
-                )
-        if "http.url" in span.attributes:
-            data.url = span.attributes["http.url"]
-            data.properties["request.url"] = span.attributes["http.url"]
-        if "http.status_code" in span.attributes:
-            status_code = span.attributes["http.status_code"]
-            data.response_code = str(status_code)
-            data.success = 200 <= status_code < 400
+        mapping = _REQUEST_MAPPING
     else:
         envelope.name = "Microsoft.ApplicationInsights.RemoteDependency"
         data = protocol.RemoteDependency(
@@ -121,38 +275,13 @@ def convert_span_to_envelope(span: Span) -> protocol.Envelope:
         envelope.data = protocol.Data(
             base_data=data, base_type="RemoteDependencyData"
         )
-        if span.kind in (SpanKind.CLIENT, SpanKind.PRODUCER):
-            if (
-                "component" in span.attributes
-                and span.attributes["component"] == "http"
-            ):
-                # TODO: check other component types (e.g. db)
-                data.type = "HTTP"
-            if "http.url" in span.attributes:
-                url = span.attributes["http.url"]
-                # data is the url
-                data.data = url
-                parse_url = urlparse(url)
-                # TODO: error handling, probably put scheme as well
-                # target matches authority (host:port)
-                data.target = parse_url.netloc
-                if "http.method" in span.attributes:
-                    # name is METHOD/path
-                    data.name = (
-                        span.attributes["http.method"] + "/" + parse_url.path
-                    )
-            if "http.status_code" in span.attributes:
-                status_code = span.attributes["http.status_code"]
-                data.result_code = str(status_code)
-                data.success = 200 <= status_code < 400
-        else:  # SpanKind.INTERNAL
+        mapping = _DEPENDENCY_MAPPING
+        if span.kind not in (SpanKind.CLIENT, SpanKind.PRODUCER):
+            # SpanKind.INTERNAL
             data.type = "InProc"
             data.success = True
-    for key in span.attributes:
-        # This removes redundant data from ApplicationInsights
-        if key.startswith("http."):
-            continue
-        data.properties[key] = span.attributes[key]
+            mapping = _INTERNAL_MAPPING
+    mapping.apply(envelope, data, span.attributes)
     if span.links:
         links = []
         for link in span.links:
@@ -0,0 +1,122 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+import collections
+import logging
+import threading
+import time
+import typing
+
+logger = logging.getLogger(__name__)
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+
+# pylint: disable=broad-except
+class ExportWorker(threading.Thread):
+    """Thread that sends queued batches off the caller's thread.
+
+    Batches are kept in a bounded ring buffer. When the buffer is full the
+    policy decides whether the oldest batch is evicted, the new batch is
+    rejected, or the caller waits for room.
+
+    Args:
+        function: Called with each dequeued batch.
+        max_size: Maximum number of batches waiting to be sent.
+        policy: One of "drop_oldest", "drop_newest" or "block".
+        block_timeout: Seconds a caller waits for room with "block".
+    """
+
+    def __init__(
+        self,
+        function: typing.Callable[[typing.Any], typing.Any],
+        max_size: int,
+        policy: str = DROP_OLDEST,
+        block_timeout: float = None,
+    ):
+        super().__init__(name="AzureMonitorExportWorker")
+        self.daemon = True
+        self.function = function
+        self.max_size = max_size
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._busy = False
+        self._finished = False
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queue)
+
+    def put(self, batch) -> bool:
+        """Queues a batch, returns False if the batch was not accepted."""
+        with self._condition:
+            if self._finished:
+                return False
+            if len(self._queue) >= self.max_size:
+                if self.policy == BLOCK:
+                    self._condition.wait_for(
+                        lambda: len(self._queue) < self.max_size
+                        or self._finished,
+                        self.block_timeout,
+                    )
+                elif self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                    logger.warning(
+                        "Export queue is full, dropping the oldest batch."
+                    )
+            if self._finished or len(self._queue) >= self.max_size:
+                self.dropped += 1
+                logger.warning("Export queue is full, dropping the batch.")
+                return False
+            self._queue.append(batch)
+            self._condition.notify_all()
+            return True
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+                self._condition.wait_for(lambda: self._queue or self._finished)
+                if not self._queue:
+                    return
+                batch = self._queue.popleft()
+                self._busy = True
+                self._condition.notify_all()
+            try:
+                self.function(batch)
+            except Exception:
+                logger.exception("Exception occurred while exporting.")
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until every queued batch has been sent."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._busy, timeout
+            )
+
+    def stop(self, timeout: float = None) -> typing.List[typing.Any]:
+        """Sends what is still queued within the timeout, then stops.
+
+        Returns the batches that were still queued once the timeout elapsed,
+        which are left to the caller.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.flush(timeout)
+        with self._condition:
+            self._finished = True
+            remaining = list(self._queue)
+            self._queue.clear()
+            self._condition.notify_all()
+        if self.is_alive():
+            self.join(
+                None
+                if deadline is None
+                else max(deadline - time.monotonic(), 0)
+            )
+        return remaining
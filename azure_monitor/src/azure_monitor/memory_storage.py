@@ -0,0 +1,192 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import collections
+import logging
+import threading
+
+from azure_monitor import serialization
+from azure_monitor.storage import (
+    DROP_LOWEST_PRIORITY,
+    DROP_NEWEST,
+    _drop_deleted,
+    _fmt,
+    _item_priority,
+    _now,
+    _RecordBlob,
+    _RecordStorageMixin,
+    _seconds,
+    _storage_full,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _MemoryRecord:
+    __slots__ = ("payload", "size", "created", "priority", "lease", "deleted")
+
+    def __init__(self, payload, priority, lease=None):
+        self.payload = payload
+        self.size = sum(len(item) for item in payload)
+        self.created = _fmt(_now())
+        self.priority = priority
+        self.lease = lease
+        self.deleted = False
+
+
+class MemoryBlob(_RecordBlob):
+    def get_raw(self):
+        """Returns the envelopes as they were serialized, without decoding."""
+        return self._record.payload
+
+
+class MemoryStorage(_RecordStorageMixin):
+    """Storage that keeps batches in memory instead of on disk.
+
+    Meant for containers where the disk is read-only or too small to be
+    worth writing to. Batches are kept serialized, in the order they were
+    put, and leased, retried and evicted the same way as with the local
+    file storage, up to ``max_size`` bytes of serialized envelopes. Nothing
+    survives the process and no maintenance thread is started, expired
+    batches are dropped as the storage is read.
+    """
+
+    def __init__(
+        self,
+        max_size=50 * 1024 * 1024,  # 50MiB
+        retention_period=7 * 24 * 60 * 60,  # 7 days
+        eviction_policy=DROP_NEWEST,
+    ):
+        self.max_size = max_size
+        self.retention_period = retention_period
+        self.eviction_policy = eviction_policy
+        self._lock = threading.Lock()
+        # batches in the order they were put, deleted batches are dropped
+        # once they reach the front; the batches are also kept by priority
+        # for eviction
+        self._records = collections.deque()
+        self._priorities = {}
+        self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._records.clear()
+            self._priorities.clear()
+            self._size = 0
+
+    def __enter__(self):
+        return self
+
+    # pylint: disable=redefined-builtin
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def gets(self):
+        now = _now()
+        lease_deadline = _fmt(now)
+        retention_deadline = _fmt(now - _seconds(self.retention_period))
+        with self._lock:
+            for record in self._records:
+                if record.created >= retention_deadline:
+                    break
+                self._delete_record(record)  # TODO: log data loss
+            self._compact()
+            records = list(self._records)
+        yield from self._blobs(records, lease_deadline, MemoryBlob)
+
+    def get(self):
+        cursor = self.gets()
+        try:
+            return next(cursor)
+        except StopIteration:
+            pass
+        return None
+
+    def put(self, data, lease_period=0):
+        payload = tuple(
+            item if isinstance(item, bytes) else serialization.dumps(item)
+            for item in data
+        )
+        priority = None
+        if self.eviction_policy == DROP_LOWEST_PRIORITY:
+            priority = max(map(_item_priority, payload), default=0)
+        lease = None
+        if lease_period:
+            lease = _fmt(_now() + _seconds(lease_period))
+        record = _MemoryRecord(payload, priority, lease)
+        with self._lock:
+            if self.eviction_policy != DROP_NEWEST:
+                self._evict(priority)
+            if not self._check_storage_size():
+                return None
+            self._records.append(record)
+            if priority is not None:
+                self._priorities.setdefault(
+                    priority, collections.deque()
+                ).append(record)
+            self._size += record.size
+        return MemoryBlob(self, record, lease)
+
+    def _evict(self, priority=None):
+        """Drops stored batches until the storage is no longer full.
+
+        The oldest batches go first. With a priority, only batches with a
+        lower or the same priority are dropped, the lowest first.
+        """
+        while self._size >= self.max_size:
+            records = None
+            if priority is None:
+                records = self._records
+            else:
+                for key in sorted(self._priorities):
+                    if key > priority:
+                        break
+                    if self._priorities[key]:
+                        records = self._priorities[key]
+                        break
+            if not records:
+                return
+            record = records[0]
+            logger.warning(
+                "Persistent storage max capacity has been reached, "
+                "dropping stored telemetry created at %s.",
+                record.created,
+            )
+            self._delete_record(record)
+            self._compact()
+
+    def _delete_record(self, record):
+        if record.deleted:
+            return
+        record.deleted = True
+        record.payload = None
+        self._size = max(self._size - record.size, 0)
+        if record.priority is not None:
+            _drop_deleted(self._priorities.get(record.priority, ()))
+
+    def _check_storage_size(self):
+        return not _storage_full(self._size, self.max_size)
+
+
+class NullStorage:
+    """Storage that keeps nothing, batches that failed are dropped."""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    # pylint: disable=redefined-builtin
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def gets(self):
+        yield from ()
+
+    def get(self):
+        return None
+
+    # pylint: disable=unused-argument
+    def put(self, data, lease_period=0):
+        return None
@@ -10,6 +10,15 @@ from azure_monitor.protocol import BaseObject
 INGESTION_ENDPOINT = "ingestionendpoint"
 INSTRUMENTATION_KEY = "instrumentationkey"
 TEMPDIR_PREFIX = "opentelemetry-python-"
+COMPRESSION_TYPES = ("deflate", "gzip")
+EXPORT_QUEUE_POLICIES = ("block", "drop_newest", "drop_oldest")
+STORAGE_DURABILITY_MODES = ("group", "none", "put")
+STORAGE_EVICTION_POLICIES = (
+    "drop_lowest_priority",
+    "drop_newest",
+    "drop_oldest",
+)
+STORAGE_TYPES = ("file", "memory", "none", "segment")
 
 # Validate UUID format
 # Specs taken from https://tools.ietf.org/html/rfc4122
@@ -26,50 +35,187 @@ class ExporterOptions(BaseObject):
     """Options to configure Azure exporters.
 
     Args:
+        async_export: Queue batches in export and send them from a background
+            worker instead of blocking the caller.
+        chunked_upload: Stream request bodies with chunked transfer encoding
+            instead of building each body in memory.
+        circuit_breaker_reset_timeout: Seconds before a single probe request is
+            sent to find out whether ingestion has recovered.
+        circuit_breaker_threshold: Consecutive failed requests after which
+            ingestion is no longer contacted and batches go straight to local
+            storage.
+        compression: Content encoding used for ingestion requests, "gzip",
+            "deflate" or None to send uncompressed payloads.
+        compression_level: Compression level from 1 (fastest) to 9 (smallest).
+        compression_min_size: Payloads smaller than this many bytes are sent
+            uncompressed.
+        connection_idle_timeout: Seconds a pooled connection may stay idle
+            before the pool is dropped, None to keep connections open.
+        connection_pool_size: Maximum number of pooled keep-alive
+            connections to the ingestion endpoint.
         connection_string: Azure Connection String.
+        export_queue_policy: What to do when the export queue is full,
+            "drop_oldest", "drop_newest" or "block" (wait up to timeout for
+            room).
+        export_queue_size: Maximum number of batches waiting in the export
+            queue.
         instrumentation_key: Azure Instrumentation Key.
+        max_batch_items: Maximum number of envelopes sent in a single request,
+            larger batches are split.
+        max_batch_size: Maximum serialized size in bytes of a single request,
+            larger batches are split.
         proxies: Proxies to pass Azure Monitor request through.
+        retry_initial_delay: Seconds to wait before contacting ingestion again
+            after a retryable failure, doubled on every consecutive failure.
+        retry_max_delay: Upper bound in seconds of the retry delay, unless
+            ingestion asks for a longer one through Retry-After.
+        storage_commit_interval: Seconds during which batches stored in local
+            storage are gathered into a single file write, 0 to write each
+            batch on its own. Only used by the "file" storage type.
+        storage_commit_size: Bytes of gathered batches after which they are
+            written right away.
+        storage_compression: Compress the batches kept in local storage, so
+            that the same storage_max_size holds more telemetry.
+        storage_drain_concurrency: Maximum number of stored batches sent
+            concurrently when replaying local storage.
+        storage_durability: When batches written to local storage are synced to
+            disk, "none" to leave it to the operating system, "group" to sync
+            every write and wait for the batches gathered with it to be
+            written, or "put" to write and sync every batch on its own. Only
+            used by the "file" storage type.
+        storage_eviction_policy: What to do when local storage is full,
+            "drop_newest" to drop the batch being stored, "drop_oldest" to
+            remove the oldest stored batches or "drop_lowest_priority" to
+            remove stored batches holding less important telemetry first
+            (metrics, then traces, then dependencies and events), never more
+            important than the batch being stored.
+        storage_exclusive: Whether to claim the local storage directory for
+            this process with a lock. Its blobs are then leased in memory
+            instead of being renamed, and small stored batches are merged into
+            a single request when replayed. Only used by the "file" storage
+            type.
         storage_maintenance_period: Local storage maintenance interval in seconds.
         storage_max_size: Local storage maximum size in bytes.
         storage_path: Local storage file path.
         storage_retention_period: Local storage retention period in seconds
+        storage_type: How batches are kept in local storage, "file" for a file
+            per batch, "segment" for batches appended to rotating segment
+            files, which falls back to "file" when another process uses
+            storage_path, "memory" to keep them in memory only, up to
+            storage_max_size bytes, or "none" to drop failed batches.
         timeout: Request timeout in seconds
     """
 
     __slots__ = (
+        "async_export",
+        "chunked_upload",
+        "circuit_breaker_reset_timeout",
+        "circuit_breaker_threshold",
+        "compression",
+        "compression_level",
+        "compression_min_size",
+        "connection_idle_timeout",
+        "connection_pool_size",
         "connection_string",
         "endpoint",
+        "export_queue_policy",
+        "export_queue_size",
         "instrumentation_key",
+        "max_batch_items",
+        "max_batch_size",
         "proxies",
+        "retry_initial_delay",
+        "retry_max_delay",
+        "storage_commit_interval",
+        "storage_commit_size",
+        "storage_compression",
+        "storage_drain_concurrency",
+        "storage_durability",
+        "storage_eviction_policy",
+        "storage_exclusive",
         "storage_maintenance_period",
         "storage_max_size",
         "storage_path",
         "storage_retention_period",
+        "storage_type",
         "timeout",
     )
 
-    def __init__(
+    # every option is a keyword argument of its own, which pylint counts as
+    # a local; grouping them would break the flat keyword API
+    def __init__(  # pylint: disable=too-many-locals
         self,
+        async_export: bool = False,
+        chunked_upload: bool = False,
+        circuit_breaker_reset_timeout: float = 30.0,
+        circuit_breaker_threshold: int = 5,
+        compression: str = None,
+        compression_level: int = 6,
+        compression_min_size: int = 1024,
+        connection_idle_timeout: float = 60.0,
+        connection_pool_size: int = 10,
         connection_string: str = None,
+        export_queue_policy: str = "drop_oldest",
+        export_queue_size: int = 100,
         instrumentation_key: str = None,
+        max_batch_items: int = 1000,
+        max_batch_size: int = 1024 * 1024,
         proxies: typing.Dict[str, str] = None,
+        retry_initial_delay: float = 1.0,
+        retry_max_delay: float = 300.0,
+        storage_commit_interval: float = 0,
+        storage_commit_size: int = 1024 * 1024,
+        storage_compression: bool = False,
+        storage_drain_concurrency: int = 1,
+        storage_durability: str = "none",
+        storage_eviction_policy: str = "drop_newest",
+        storage_exclusive: bool = False,
         storage_maintenance_period: int = 60,
         storage_max_size: int = 50 * 1024 * 1024,
         storage_path: str = None,
         storage_retention_period: int = 7 * 24 * 60 * 60,
+        storage_type: str = "file",
         timeout: int = 10.0,  # networking timeout in seconds
     ) -> None:
+        self.async_export = async_export
+        self.chunked_upload = chunked_upload
+        self.circuit_breaker_reset_timeout = circuit_breaker_reset_timeout
+        self.circuit_breaker_threshold = circuit_breaker_threshold
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_min_size = compression_min_size
+        self.connection_idle_timeout = connection_idle_timeout
+        self.connection_pool_size = connection_pool_size
         self.connection_string = connection_string
+        self.export_queue_policy = export_queue_policy
+        self.export_queue_size = export_queue_size
         self.instrumentation_key = instrumentation_key
+        self.max_batch_items = max_batch_items
+        self.max_batch_size = max_batch_size
         self.proxies = proxies
+        self.retry_initial_delay = retry_initial_delay
+        self.retry_max_delay = retry_max_delay
+        self.storage_commit_interval = storage_commit_interval
+        self.storage_commit_size = storage_commit_size
+        self.storage_compression = storage_compression
+        self.storage_drain_concurrency = storage_drain_concurrency
+        self.storage_durability = storage_durability
+        self.storage_eviction_policy = storage_eviction_policy
+        self.storage_exclusive = storage_exclusive
         self.storage_maintenance_period = storage_maintenance_period
         self.storage_max_size = storage_max_size
         self.storage_path = storage_path
         self.storage_retention_period = storage_retention_period
+        self.storage_type = storage_type
         self.timeout = timeout
         self.endpoint = ""
         self._initialize()
         self._validate_instrumentation_key()
+        self._validate_compression()
+        self._validate_export_queue()
+        self._validate_transmission()
+        self._validate_circuit_breaker()
+        self._validate_storage()
 
     def _initialize(self) -> None:
         # connection string and ikey
@@ -125,6 +271,47 @@ class ExporterOptions(BaseObject):
         if not match:
             raise ValueError("Invalid instrumentation key.")
 
+    def _validate_compression(self) -> None:
+        if (
+            self.compression is not None
+            and self.compression not in COMPRESSION_TYPES
+        ):
+            raise ValueError("Invalid compression type.")
+        if not 1 <= self.compression_level <= 9:
+            raise ValueError("Compression level must be between 1 and 9.")
+
+    def _validate_export_queue(self) -> None:
+        if self.export_queue_policy not in EXPORT_QUEUE_POLICIES:
+            raise ValueError("Invalid export queue policy.")
+        if self.export_queue_size < 1:
+            raise ValueError("Export queue size must be at least 1.")
+
+    def _validate_transmission(self) -> None:
+        if self.connection_pool_size < 1:
+            raise ValueError("Connection pool size must be at least 1.")
+        if self.max_batch_items < 1:
+            raise ValueError("Max batch items must be at least 1.")
+        if self.max_batch_size < 1:
+            raise ValueError("Max batch size must be at least 1.")
+        if self.storage_drain_concurrency < 1:
+            raise ValueError("Storage drain concurrency must be at least 1.")
+
+    def _validate_circuit_breaker(self) -> None:
+        if self.circuit_breaker_threshold < 1:
+            raise ValueError("Circuit breaker threshold must be at least 1.")
+        if self.circuit_breaker_reset_timeout <= 0:
+            raise ValueError("Circuit breaker reset timeout must be positive.")
+
+    def _validate_storage(self) -> None:
+        if self.storage_type not in STORAGE_TYPES:
+            raise ValueError("Invalid storage type.")
+        if self.storage_eviction_policy not in STORAGE_EVICTION_POLICIES:
+            raise ValueError("Invalid storage eviction policy.")
+        if self.storage_durability not in STORAGE_DURABILITY_MODES:
+            raise ValueError("Invalid storage durability mode.")
+        if self.storage_commit_interval < 0:
+            raise ValueError("Storage commit interval cannot be negative.")
+
 
 def parse_connection_string(connection_string) -> typing.Dict:
     if connection_string is None:
@@ -1,6 +1,7 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import collections.abc
 import typing
 from enum import Enum
 
@@ -21,6 +22,78 @@ class BaseObject:
         return repr(tmp)
 
 
+class ContextTags(collections.abc.MutableMapping):
+    """Tags of an envelope layered over tags shared by many envelopes.
+
+    The shared tags are neither copied nor changed, setting a tag only
+    changes the envelope's own tags, which take precedence. Deleting a
+    shared tag hides it from this envelope only.
+
+    Args:
+        tags: Tags of the envelope.
+        shared: Tags shared with other envelopes, e.g. the context tags.
+    """
+
+    __slots__ = ("tags", "shared", "deleted")
+
+    def __init__(
+        self, tags: typing.Dict = None, shared: typing.Mapping = None
+    ) -> None:
+        self.tags = {} if tags is None else tags
+        self.shared = {} if shared is None else shared
+        # shared tags deleted from this envelope, created on first delete
+        self.deleted = None
+
+    def __getitem__(self, key):
+        try:
+            return self.tags[key]
+        except KeyError:
+            if self.deleted and key in self.deleted:
+                raise
+            return self.shared[key]
+
+    def __setitem__(self, key, value):
+        self.tags[key] = value
+        if self.deleted:
+            self.deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.tags.pop(key, None)
+        if key in self.shared:
+            if self.deleted is None:
+                self.deleted = set()
+            self.deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self.tags:
+            return True
+        return key in self.shared and not (
+            self.deleted and key in self.deleted
+        )
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        if not self.deleted:
+            return {**self.shared, **self.tags}
+        result = {
+            key: value
+            for key, value in self.shared.items()
+            if key not in self.deleted
+        }
+        result.update(self.tags)
+        return result
+
+
 class Data(BaseObject):
     """Data
 
@@ -162,6 +235,9 @@ class Envelope(BaseObject):
         self.data = data
 
     def to_dict(self):
+        tags = self.tags
+        if isinstance(tags, ContextTags):
+            tags = tags.to_dict()
         return {
             "ver": self.ver,
             "name": self.name,
@@ -170,7 +246,7 @@ class Envelope(BaseObject):
             "seq": self.seq,
             "iKey": self.ikey,
             "flags": self.flags,
-            "tags": self.tags,
+            "tags": tags,
             "data": self.data.to_dict() if self.data else None,
         }
 
@@ -1,11 +1,11 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 #
-import json
 import logging
 
 import requests
 
+from azure_monitor import serialization
 from azure_monitor.protocol import LiveMetricEnvelope
 from azure_monitor.sdk.auto_collection.live_metrics import utils
 
@@ -22,12 +22,18 @@ class LiveMetricsSender:
         self._instrumentation_key = instrumentation_key
 
     def ping(self, envelope: LiveMetricEnvelope):
-        return self._send_request(json.dumps(envelope.to_dict()), "ping")
+        return self._send_request(
+            serialization.dumps(envelope.to_dict()), "ping"
+        )
 
     def post(self, envelope: LiveMetricEnvelope):
-        return self._send_request(json.dumps([envelope.to_dict()]), "post")
+        return self._send_request(
+            serialization.dumps([envelope.to_dict()]), "post"
+        )
 
-    def _send_request(self, data: str, request_type: str) -> requests.Response:
+    def _send_request(
+        self, data: bytes, request_type: str
+    ) -> requests.Response:
         try:
             url = "{0}/QuickPulseService.svc/{1}?ikey={2}".format(
                 utils.DEFAULT_LIVEMETRICS_ENDPOINT,
@@ -0,0 +1,418 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import collections
+import errno
+import logging
+import os
+import struct
+import threading
+import zlib
+
+from azure_monitor import serialization
+from azure_monitor.storage import (
+    _COMPRESSION_LEVEL,
+    DROP_NEWEST,
+    _claim_directory,
+    _fmt,
+    _new_name,
+    _now,
+    _RecordBlob,
+    _RecordStorageMixin,
+    _seconds,
+    _storage_full,
+    fcntl,
+)
+from azure_monitor.utils import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+# length and CRC-32 of the payload of a segment frame
+_FRAME_HEADER = struct.Struct("<II")
+# file extensions of uncompressed and compressed segments
+_SEGMENT_EXTENSIONS = (".seg", ".seg.z")
+# offset of a deleted batch, appended to the deletion file of its segment
+_DELETED_OFFSET = struct.Struct("<Q")
+_DELETED_EXTENSION = ".del"
+
+
+class _SegmentRecord:
+    __slots__ = ("segment", "offset", "lease", "deleted")
+
+    def __init__(self, segment, offset, lease=None):
+        self.segment = segment
+        self.offset = offset
+        self.lease = lease
+        self.deleted = False
+
+
+# pylint: disable=broad-except
+class SegmentBlob(_RecordBlob):
+    @property
+    def fullpath(self):
+        return os.path.join(self._storage.path, self._record.segment)
+
+    def get_raw(self):
+        """Returns the envelopes as they were serialized, without decoding."""
+        try:
+            with open(self.fullpath, "rb") as file:
+                file.seek(self._record.offset)
+                length, checksum = _FRAME_HEADER.unpack(
+                    file.read(_FRAME_HEADER.size)
+                )
+                payload = file.read(length)
+            if zlib.crc32(payload) != checksum:
+                return None
+            if self._record.segment.endswith(".z"):
+                payload = zlib.decompress(payload)
+            return tuple(payload.splitlines())
+        except Exception:
+            pass  # keep silent
+
+
+class SegmentFileStorage(_RecordStorageMixin):
+    """Local storage that appends batches to rotating segment files.
+
+    Every put appends a framed batch to the active segment instead of
+    creating a file, and leases are kept in memory instead of being
+    encoded in file names. A segment is rotated once it reaches
+    ``segment_size`` bytes and on every maintenance, and deleted as a whole
+    once all of its batches have been deleted. With ``compress`` the batches
+    are zlib compressed, in segments with a ".seg.z" extension.
+    Batches are not tracked by priority, when the storage is full both the
+    "drop_oldest" and "drop_lowest_priority" eviction policies remove the
+    oldest segment.
+
+    The offset of every batch deleted from a segment that still holds
+    other batches is appended to a deletion file next to the segment, so
+    that deleted batches are not replayed after a restart. The position of
+    the oldest batch not yet deleted is also saved as a checkpoint on
+    maintenance and close, everything before it is skipped on startup
+    without being read. The storage owns its directory, which cannot be
+    shared with other processes: where advisory locks are supported,
+    creating the storage raises OSError if another process owns it.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_size=50 * 1024 * 1024,  # 50MiB
+        maintenance_period=60,  # 1 minute
+        retention_period=7 * 24 * 60 * 60,  # 7 days
+        write_timeout=60,  # 1 minute
+        segment_size=1024 * 1024,  # 1MiB
+        compress=False,
+        eviction_policy=DROP_NEWEST,
+    ):
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.maintenance_period = maintenance_period
+        self.retention_period = retention_period
+        self.write_timeout = write_timeout
+        self.segment_size = segment_size
+        self.compress = compress
+        self.eviction_policy = eviction_policy
+        self._lock = threading.Lock()
+        # batches in the order they were appended, deleted batches are
+        # dropped once they reach the front
+        self._records = collections.deque()
+        # number of batches not deleted yet by segment name
+        self._live = {}
+        self._segment = None
+        self._file = None
+        self._size = 0
+        self._owner_file = None
+        self._claim()
+        self._recover()
+        self._maintenance_task = PeriodicTask(
+            interval=self.maintenance_period,
+            function=self._maintenance_routine,
+        )
+        self._maintenance_task.daemon = True
+        self._maintenance_task.start()
+
+    def close(self):
+        self._maintenance_task.cancel()
+        self._maintenance_task.join()
+        with self._lock:
+            self._close_segment()
+            self._write_checkpoint()
+        if self._owner_file is not None:
+            self._owner_file.close()
+            self._owner_file = None
+
+    def __enter__(self):
+        return self
+
+    # pylint: disable=redefined-builtin
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _claim(self):
+        """Takes ownership of the storage directory, raises if it cannot."""
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except Exception:
+            pass  # keep silent
+        if fcntl is None:
+            logger.warning(
+                "Local storage %s cannot be owned on this platform, it must "
+                "not be shared with other processes.",
+                self.path,
+            )
+            return
+        self._owner_file = _claim_directory(self.path)
+        if self._owner_file is None:
+            raise OSError(
+                errno.EBUSY, "Local storage cannot be owned", self.path
+            )
+
+    def _recover(self):
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, exist_ok=True)
+            files = os.listdir(self.path)
+        except Exception:
+            return  # keep silent
+        names = sorted(
+            name for name in files if name.endswith(_SEGMENT_EXTENSIONS)
+        )
+        for name in files:
+            # left behind by a segment removed before the deletion file
+            if name.endswith(_DELETED_EXTENSION) and (
+                name[: -len(_DELETED_EXTENSION)] not in names
+            ):
+                self._remove_deleted(name[: -len(_DELETED_EXTENSION)])
+        checkpoint = self._read_checkpoint()
+        for name in names:
+            start = 0
+            if checkpoint is not None:
+                if name < checkpoint[0]:
+                    self._remove_segment(name)
+                    continue
+                if name == checkpoint[0]:
+                    start = checkpoint[1]
+            deleted = self._read_deleted(name)
+            offsets = [
+                offset
+                for offset in self._read_offsets(name, start)
+                if offset not in deleted
+            ]
+            if not offsets:
+                self._remove_segment(name)
+                continue
+            try:
+                self._size += os.path.getsize(os.path.join(self.path, name))
+            except OSError:
+                pass  # keep silent
+            self._live[name] = len(offsets)
+            self._records.extend(
+                _SegmentRecord(name, offset) for offset in offsets
+            )
+
+    def _read_offsets(self, name, start):
+        """Offsets of the complete frames of a segment from start."""
+        offsets = []
+        try:
+            with open(os.path.join(self.path, name), "rb") as file:
+                file.seek(start)
+                offset = start
+                while True:
+                    header = file.read(_FRAME_HEADER.size)
+                    if len(header) < _FRAME_HEADER.size:
+                        break
+                    length, checksum = _FRAME_HEADER.unpack(header)
+                    payload = file.read(length)
+                    if (
+                        len(payload) < length
+                        or zlib.crc32(payload) != checksum
+                    ):
+                        break  # torn write, the rest is unusable
+                    offsets.append(offset)
+                    offset += _FRAME_HEADER.size + length
+        except Exception:
+            pass  # keep silent
+        return offsets
+
+    def _read_deleted(self, name):
+        """Offsets of the batches deleted from a segment."""
+        try:
+            with open(
+                os.path.join(self.path, name + _DELETED_EXTENSION), "rb"
+            ) as file:
+                data = file.read()
+        except Exception:
+            return set()  # keep silent, e.g. nothing deleted
+        # an offset torn by a crash is ignored, its batch is replayed
+        end = len(data) - len(data) % _DELETED_OFFSET.size
+        return {offset for offset, in _DELETED_OFFSET.iter_unpack(data[:end])}
+
+    def _write_deleted(self, record):
+        try:
+            with open(
+                os.path.join(self.path, record.segment + _DELETED_EXTENSION),
+                "ab",
+            ) as file:
+                file.write(_DELETED_OFFSET.pack(record.offset))
+        except Exception:
+            pass  # keep silent, the batch is replayed after a restart
+
+    def _remove_deleted(self, name):
+        try:
+            os.remove(os.path.join(self.path, name + _DELETED_EXTENSION))
+        except Exception:
+            pass  # keep silent, e.g. nothing deleted
+
+    def _read_checkpoint(self):
+        try:
+            with open(
+                os.path.join(self.path, "checkpoint"), encoding="utf-8"
+            ) as file:
+                name, offset = file.read().split()
+            return name, int(offset)
+        except Exception:
+            return None
+
+    def _write_checkpoint(self):
+        if self._records:
+            checkpoint = (self._records[0].segment, self._records[0].offset)
+        elif self._file is not None:
+            checkpoint = (self._segment, self._file.tell())
+        else:
+            # every segment has been deleted, nothing to skip on startup
+            checkpoint = ("", 0)
+        fullpath = os.path.join(self.path, "checkpoint")
+        try:
+            with open(fullpath + ".tmp", "w", encoding="utf-8") as file:
+                file.write("{} {}".format(*checkpoint))
+            os.replace(fullpath + ".tmp", fullpath)
+        except Exception:
+            pass  # keep silent
+
+    def _maintenance_routine(self):
+        retention_deadline = _fmt(_now() - _seconds(self.retention_period))
+        with self._lock:
+            # so that the batches appended since the last maintenance can be
+            # reclaimed as a whole once consumed or expired
+            if self._file is not None and self._file.tell():
+                self._close_segment()
+            for record in self._records:
+                if not record.deleted and record.segment < retention_deadline:
+                    # whole segments expire, removing them is enough
+                    # TODO: log data loss
+                    self._delete_record(record, persist=False)
+            self._compact()
+            self._write_checkpoint()
+
+    def gets(self):
+        lease_deadline = _fmt(_now())
+        with self._lock:
+            records = list(self._records)
+        yield from self._blobs(records, lease_deadline, SegmentBlob)
+
+    def get(self):
+        cursor = self.gets()
+        try:
+            return next(cursor)
+        except StopIteration:
+            pass
+        return None
+
+    def put(self, data, lease_period=0):
+        if self.eviction_policy != DROP_NEWEST:
+            with self._lock:
+                self._evict()
+        if not self._check_storage_size():
+            return None
+        payload = b"".join(
+            (item if isinstance(item, bytes) else serialization.dumps(item))
+            + b"\n"
+            for item in data
+        )
+        if self.compress:
+            payload = zlib.compress(payload, _COMPRESSION_LEVEL)
+        frame = _FRAME_HEADER.pack(len(payload), zlib.crc32(payload))
+        lease = None
+        if lease_period:
+            lease = _fmt(_now() + _seconds(lease_period))
+        with self._lock:
+            try:
+                if (
+                    self._file is None
+                    or self._file.tell() >= self.segment_size
+                ):
+                    self._open_segment()
+                offset = self._file.tell()
+                self._file.write(frame + payload)
+                self._file.flush()
+            except Exception:
+                # do not append after a partially written frame
+                self._close_segment()
+                return None
+            record = _SegmentRecord(self._segment, offset, lease)
+            self._records.append(record)
+            self._live[self._segment] = self._live.get(self._segment, 0) + 1
+            self._size += len(frame) + len(payload)
+        return SegmentBlob(self, record, lease)
+
+    def _open_segment(self):
+        self._close_segment()
+        name = _new_name(_SEGMENT_EXTENSIONS[self.compress])
+        self._file = open(os.path.join(self.path, name), "ab")
+        self._segment = name
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except Exception:
+            pass  # keep silent
+        name = self._segment
+        self._file = None
+        self._segment = None
+        if not self._live.get(name):
+            self._remove_segment(name)
+
+    def _evict(self):
+        """Removes the oldest segments until the storage is no longer full."""
+        while self._size >= self.max_size and self._records:
+            segment = self._records[0].segment
+            logger.warning(
+                "Persistent storage max capacity has been reached, "
+                "dropping stored telemetry %s.",
+                segment,
+            )
+            if segment == self._segment:
+                self._close_segment()
+            for record in self._records:
+                if record.segment != segment:
+                    break
+                self._delete_record(record, persist=False)
+            self._compact()
+
+    def _delete_record(self, record, persist=True):
+        """Deletes a batch, persisted unless its segment goes as a whole."""
+        if record.deleted:
+            return
+        record.deleted = True
+        self._live[record.segment] -= 1
+        if not self._live[record.segment] and record.segment != self._segment:
+            self._remove_segment(record.segment)
+        elif persist:
+            self._write_deleted(record)
+
+    def _remove_segment(self, name):
+        self._live.pop(name, None)
+        path = os.path.join(self.path, name)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except Exception:
+            pass  # keep silent
+        else:
+            self._size = max(self._size - size, 0)
+        self._remove_deleted(name)
+
+    def _check_storage_size(self):
+        return not _storage_full(self._size, self.max_size)
@@ -0,0 +1,92 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+"""JSON encoding used for telemetry payloads and local storage.
+
+The fastest available backend is picked at import time: orjson, then
+ujson, then the standard library. Every backend produces UTF-8 encoded
+JSON on a single line, so their output can be mixed freely.
+"""
+import json
+import typing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _json_dumps(obj: typing.Any) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def _json_loads(data: typing.Union[bytes, str]) -> typing.Any:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def _orjson_dumps(obj: typing.Any) -> bytes:
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # e.g. integers that do not fit in 64 bits
+        return _json_dumps(obj)
+
+
+def _ujson_dumps(obj: typing.Any) -> bytes:
+    try:
+        return ujson.dumps(obj, escape_forward_slashes=False).encode("utf-8")
+    except (OverflowError, TypeError):
+        return _json_dumps(obj)
+
+
+_BACKENDS = {"json": (_json_dumps, _json_loads)}
+if ujson is not None:
+    _BACKENDS["ujson"] = (_ujson_dumps, ujson.loads)
+if orjson is not None:
+    _BACKENDS["orjson"] = (_orjson_dumps, orjson.loads)
+
+_backend = None
+_dumps = None
+_loads = None
+
+
+def available_backends() -> typing.List[str]:
+    """Names of the backends that can be used, fastest first."""
+    return [name for name in ("orjson", "ujson", "json") if name in _BACKENDS]
+
+
+def get_backend() -> str:
+    """Name of the backend in use."""
+    return _backend
+
+
+def set_backend(name: str) -> None:
+    """Switches to the given backend.
+
+    Raises ValueError if the backend is unknown or not installed.
+    """
+    # pylint: disable=global-statement
+    global _backend, _dumps, _loads
+    if name not in _BACKENDS:
+        raise ValueError("JSON backend {} is not available.".format(name))
+    _backend = name
+    _dumps, _loads = _BACKENDS[name]
+
+
+def dumps(obj: typing.Any) -> bytes:
+    """Encodes the object as UTF-8 encoded JSON."""
+    return _dumps(obj)
+
+
+def loads(data: typing.Union[bytes, str]) -> typing.Any:
+    """Decodes JSON given as bytes or string."""
+    return _loads(data)
+
+
+set_backend(available_backends()[0])
@@ -1,16 +1,52 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import bisect
 import datetime
-import json
+import gzip
+import itertools
 import logging
+import mmap
 import os
 import random
+import threading
+import time
 
+from azure_monitor import serialization
 from azure_monitor.utils import PeriodicTask
 
+try:
+    import fcntl
+except ImportError:
+    # Windows, where a file that is open cannot be renamed or removed
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+DROP_LOWEST_PRIORITY = "drop_lowest_priority"
+
+DURABILITY_NONE = "none"
+DURABILITY_GROUP = "group"
+DURABILITY_PUT = "put"
+
+# file extensions of uncompressed and compressed blobs, files without the
+# compressed one are read as is so that both can be mixed in the same
+# directory
+_BLOB_EXTENSIONS = (".blob", ".blob.gz")
+_COMPRESSION_LEVEL = 6
+# importance of telemetry by base type, when storage is full and evicts by
+# priority the blobs holding only less important telemetry go first
+_TELEMETRY_PRIORITIES = {
+    "ExceptionData": 3,
+    "RequestData": 3,
+    "EventData": 2,
+    "RemoteDependencyData": 2,
+    "MessageData": 1,
+    "MetricData": 0,
+}
+
 
 def _fmt(timestamp):
     return timestamp.strftime("%Y-%m-%dT%H%M%S.%f")
@@ -24,57 +60,426 @@ def _seconds(seconds):
     return datetime.timedelta(seconds=seconds)
 
 
+def _split_lease(name):
+    """Splits a blob file name into its unleased name and lease deadline."""
+    if name.endswith(".lock"):
+        index = name.rindex("@")
+        return name[:index], name[index + 1 : -5]
+    return name, None
+
+
+def _open_blob(fullpath, mode):
+    name, _ = _split_lease(os.path.basename(fullpath))
+    if name.endswith(".gz") or name.endswith(".gz.tmp"):
+        return gzip.open(fullpath, mode, compresslevel=_COMPRESSION_LEVEL)
+    return open(fullpath, mode)
+
+
+def _fsync(path):
+    """Flushes a file, or the entries of a directory, to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _try_lock(file):
+    """Takes the exclusive advisory lock of an open file without waiting.
+
+    The lock is shared by the processes using the same storage directory and
+    released when the file is closed.
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _is_locked(path):
+    """Whether a file is being written or sent, possibly by another process."""
+    if fcntl is None:
+        return False
+    try:
+        with open(path, "rb") as file:
+            return not _try_lock(file)
+    except OSError:
+        return False
+
+
+def _new_name(extension, priority=None):
+    return "{}-{}{}{}".format(
+        _fmt(_now()),
+        "{:08x}".format(random.getrandbits(32)),  # thread-safe random
+        "" if priority is None else "-p{}".format(priority),
+        extension,
+    )
+
+
+def _name_priority(name):
+    """Priority encoded in a blob name, 0 if there is none."""
+    tail = name[: name.index(".blob")].rsplit("-", 1)[-1]
+    if tail.startswith("p") and tail[1:].isdigit():
+        return int(tail[1:])
+    return 0
+
+
+def _item_priority(item):
+    """Priority of an envelope, given as a dictionary or serialized."""
+    if isinstance(item, bytes):
+        # the key cannot appear verbatim inside a string value, where its
+        # quotes would be escaped, but it can be a key of the properties;
+        # the envelope's own is the last one, as it follows the base data
+        start = item.rfind(b'"baseType"')
+        if start < 0:
+            return 0
+        value = item[start + 10 :].lstrip(b": \t")
+        if not value.startswith(b'"'):
+            return 0  # null
+        base_type = value[1 : value.find(b'"', 1)].decode("ascii", "ignore")
+    elif isinstance(item, dict):
+        base_type = (item.get("data") or {}).get("baseType")
+    else:
+        return 0
+    return _TELEMETRY_PRIORITIES.get(base_type, 0)
+
+
+def _storage_full(size, max_size):
+    if size >= max_size:
+        # pylint: disable=logging-format-interpolation
+        logger.warning(
+            "Persistent storage max capacity has been "
+            "reached. Currently at {}KB. Telemetry will be "
+            "lost. Please consider increasing the value of "
+            "'storage_max_size' in exporter config.".format(str(size / 1024))
+        )
+        return True
+    return False
+
+
+def _claim_directory(path):
+    """Takes the advisory lock of the owner file of a storage directory.
+
+    Returns the owner file, which holds the lock until it is closed, or None
+    if the directory is owned by another process.
+    """
+    try:
+        file = open(os.path.join(path, "owner"), "ab")
+    except Exception:
+        return None  # keep silent
+    if not _try_lock(file):
+        file.close()
+        return None
+    return file
+
+
 # pylint: disable=broad-except
 class LocalFileBlob:
-    def __init__(self, fullpath):
+    def __init__(self, fullpath, storage=None):
         self.fullpath = fullpath
+        self._storage = storage
+        # open while the blob is leased, holding its advisory lock
+        self._lock_file = None
+        # lease kept in memory by a storage that owns its directory
+        self._held = None
+
+    def close(self):
+        """Releases the advisory lock taken by lease."""
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
 
     def delete(self):
+        if self.fullpath is None:
+            return  # not written yet
+        if self._storage is not None:
+            # pylint: disable=protected-access
+            self._storage._remove(self.fullpath)
+        else:
+            try:
+                os.remove(self.fullpath)
+            except Exception:
+                pass  # keep silent
+        self.close()
+
+    def get(self):
         try:
-            os.remove(self.fullpath)
+            return tuple(serialization.loads(line) for line in self.get_raw())
         except Exception:
             pass  # keep silent
 
-    def get(self):
+    def get_raw(self):
+        """Returns the envelopes as they were serialized, without decoding."""
         try:
-            with open(self.fullpath, "r") as file:
-                return tuple(
-                    json.loads(line.strip()) for line in file.readlines()
-                )
+            with _open_blob(self.fullpath, "rb") as file:
+                return tuple(line.strip() for line in file.readlines())
         except Exception:
             pass  # keep silent
 
-    def put(self, data, lease_period=0):
+    def iter_raw(self):
+        """Yields the serialized envelopes one at a time.
+
+        Uncompressed blobs are memory-mapped and compressed ones are
+        decompressed as they are read, so the blob is never loaded as a
+        whole.
+        """
+        try:
+            with _open_blob(self.fullpath, "rb") as file:
+                if isinstance(file, gzip.GzipFile):
+                    for line in file:
+                        yield line.strip()
+                    return
+                with mmap.mmap(
+                    file.fileno(), 0, access=mmap.ACCESS_READ
+                ) as data:
+                    start = 0
+                    while start < len(data):
+                        end = data.find(b"\n", start)
+                        if end < 0:
+                            end = len(data)
+                        yield data[start:end].strip()
+                        start = end + 1
+        except Exception:
+            pass  # keep silent, e.g. an empty file cannot be mapped
+
+    def put(self, data, lease_period=0, fsync=False):
+        """Writes the blob, synced to disk before it is returned with fsync."""
         try:
-            fullpath = self.fullpath + ".tmp"
-            with open(fullpath, "w") as file:
-                for item in data:
-                    file.write(json.dumps(item))
-                    # The official Python doc: Do not use os.linesep as a line
-                    # terminator when writing files opened in text mode (the
-                    # default); use a single '\n' instead, on all platforms.
-                    file.write("\n")
-            if lease_period:
-                timestamp = _now() + _seconds(lease_period)
-                self.fullpath += "@{}.lock".format(_fmt(timestamp))
-            os.rename(fullpath, self.fullpath)
-            return self
+            return self._write(data, lease_period, fsync)
         except Exception:
             pass  # keep silent
 
+    def _write(self, data, lease_period, fsync):
+        """Writes the blob, raises if it cannot."""
+        fullpath = self.fullpath + ".tmp"
+        with _open_blob(fullpath, "wb") as file:
+            # not to be mistaken for an abandoned file while written
+            _try_lock(file)
+            for item in data:
+                if not isinstance(item, bytes):
+                    item = serialization.dumps(item)
+                file.write(item)
+                # one envelope per line, the same on all platforms
+                file.write(b"\n")
+        if fsync:
+            _fsync(fullpath)
+        if lease_period:
+            timestamp = _now() + _seconds(lease_period)
+            self.fullpath += "@{}.lock".format(_fmt(timestamp))
+        os.rename(fullpath, self.fullpath)
+        if fsync:
+            try:
+                _fsync(os.path.dirname(self.fullpath))
+            except OSError:
+                pass  # directories cannot be opened on Windows
+        return self
+
     def lease(self, period):
+        """Leases the blob, returns None if it is leased by someone else.
+
+        Where advisory locks are supported the lease also holds the lock
+        of the file until the blob is closed or deleted, so that no other
+        process takes the blob over while it is being sent, even after the
+        lease expired. The blobs of a storage that owns its directory are
+        leased in memory, without renaming the file, but still under its
+        lock so that processes that failed to own the directory leave them
+        alone. A blob that has not been written yet cannot be leased.
+        """
+        if self.fullpath is None:
+            return None
+        if self._storage is not None and self._storage.exclusive:
+            return self._hold(period)
         timestamp = _now() + _seconds(period)
         fullpath = self.fullpath
         if fullpath.endswith(".lock"):
             fullpath = fullpath[: fullpath.rindex("@")]
         fullpath += "@{}.lock".format(_fmt(timestamp))
+        locked = fcntl is not None and self._lock_file is None
+        if locked and not self._lock():
+            return None
         try:
             os.rename(self.fullpath, fullpath)
         except Exception:
+            if locked:
+                self.close()
             return None
         self.fullpath = fullpath
+        if self._storage is not None:
+            # pylint: disable=protected-access
+            self._storage._track(fullpath)
+        return self
+
+    def _hold(self, period):
+        """Leases the blob of a storage that owns its directory."""
+        # pylint: disable=protected-access
+        if not self._storage._hold(self, period):
+            return None
+        if not self._lock():
+            # renamed or locked, i.e. leased, by another process
+            self._storage._hold(self, 0)
+            return None
         return self
 
+    def _lock(self):
+        """Takes the advisory lock of the file, returns whether it holds it."""
+        if self._lock_file is not None:
+            return True
+        try:
+            self._lock_file = open(self.fullpath, "rb")
+        except Exception:
+            return False
+        if not _try_lock(self._lock_file):
+            self.close()
+            return False
+        return True
+
+
+def _drop_deleted(records):
+    """Drops the deleted records from the front of a deque."""
+    while records and records[0].deleted:
+        records.popleft()
+
+
+class _RecordBlob:
+    """Blob of a batch kept as a record by its storage.
+
+    The lease of the batch is kept on the record, in memory, and taken
+    through the storage; subclasses read the batch in get_raw.
+    """
+
+    def __init__(self, storage, record, lease):
+        self._storage = storage
+        self._record = record
+        # lease seen when the blob was handed out, a lease taken since then
+        # by someone else makes leasing this blob fail
+        self._lease = lease
+
+    def close(self):
+        pass  # leases are not backed by file locks
+
+    def delete(self):
+        # pylint: disable=protected-access
+        self._storage._delete(self._record)
+
+    def get(self):
+        try:
+            return tuple(serialization.loads(line) for line in self.get_raw())
+        except Exception:
+            pass  # keep silent
+
+    def get_raw(self):
+        """Returns the envelopes as they were serialized, without decoding."""
+        raise NotImplementedError
+
+    def iter_raw(self):
+        """Yields the serialized envelopes one at a time."""
+        yield from self.get_raw() or ()
+
+    def lease(self, period):
+        # pylint: disable=protected-access
+        lease = self._storage._lease(self._record, self._lease, period)
+        if lease is None:
+            return None
+        self._lease = lease
+        return self
+
+
+class _RecordStorageMixin:
+    """Lease and delete bookkeeping of a storage that keeps records.
+
+    The storage holds its records in ``_records``, in the order they were
+    put, under ``_lock``, and deletes one with ``_delete_record``.
+    """
+
+    def _blobs(self, records, lease_deadline, blob_type):
+        """Yields a blob for every record neither deleted nor under lease."""
+        for record in records:
+            lease = record.lease
+            if record.deleted or (
+                lease is not None and lease > lease_deadline
+            ):
+                continue  # deleted or under lease
+            yield blob_type(self, record, lease)
+
+    def _lease(self, record, expected, period):
+        with self._lock:
+            if record.deleted or record.lease != expected:
+                return None
+            record.lease = _fmt(_now() + _seconds(period))
+            return record.lease
+
+    def _delete(self, record):
+        with self._lock:
+            self._delete_record(record)
+            self._compact()
+
+    def _compact(self):
+        _drop_deleted(self._records)
+
+
+class _MaintenancePass:
+    """Progress of a maintenance pass over the storage directory."""
+
+    __slots__ = (
+        "entries",
+        "started",
+        "seen",
+        "removed",
+        "size",
+        "files",
+        "duration",
+    )
+
+    def __init__(self, path):
+        # files created since are accounted for by put and not counted
+        self.started = _fmt(_now())
+        self.entries = os.scandir(path)
+        self.seen = set()
+        self.removed = set()
+        self.size = 0
+        self.files = 0
+        self.duration = 0.0
+
+
+class _CommitGroup:
+    """Batches gathered to be written to a single blob."""
+
+    __slots__ = (
+        "blob",
+        "items",
+        "batches",
+        "size",
+        "lease",
+        "priority",
+        "done",
+        "timer",
+    )
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.items = []
+        self.batches = 0
+        self.size = 0
+        # latest lease deadline and highest priority of the batches
+        self.lease = None
+        self.priority = None
+        # set once written, the blob is None if writing failed
+        self.done = threading.Event()
+        self.timer = None
+
+
+class _MaintenanceTask(PeriodicTask):
+    """Runs the first maintenance pass right away, then a tick per period."""
+
+    def run(self):
+        while not self.finished.is_set():
+            if self.function(*self.args, **self.kwargs):
+                break
+        super().run()
+
 
 # pylint: disable=broad-except
 class LocalFileStorage:
@@ -85,14 +490,63 @@ class LocalFileStorage:
         maintenance_period=60,  # 1 minute
         retention_period=7 * 24 * 60 * 60,  # 7 days
         write_timeout=60,  # 1 minute
+        compress=False,
+        eviction_policy=DROP_NEWEST,
+        maintenance_batch=1000,
+        exclusive=False,
+        commit_interval=0,
+        commit_size=1024 * 1024,  # 1MiB
+        durability=DURABILITY_NONE,
     ):
         self.path = os.path.abspath(path)
         self.max_size = max_size
         self.maintenance_period = maintenance_period
         self.retention_period = retention_period
         self.write_timeout = write_timeout
-        self._maintenance_routine()
-        self._maintenance_task = PeriodicTask(
+        self.compress = compress
+        self.eviction_policy = eviction_policy
+        self.maintenance_batch = maintenance_batch
+        self.commit_interval = commit_interval
+        self.commit_size = commit_size
+        self.durability = durability
+        # batches gathered to be written together
+        self._group = None
+        self._group_lock = threading.Lock()
+        # seconds spent on the last complete maintenance pass
+        self.maintenance_duration = None
+        # running total of the bytes on disk, kept up to date on put, delete
+        # and expiry, and recomputed from disk by every maintenance pass
+        self._size = 0
+        self._size_lock = threading.Lock()
+        # names of the blobs being written, counted by put and not by a
+        # maintenance pass that lists them before put accounted for them
+        self._writing = set()
+        # blobs on disk by unleased file name, which starts with the creation
+        # time, mapped to their lease deadline; synchronized with the disk by
+        # every maintenance pass to pick up changes made by other processes;
+        # the names are also kept by priority for eviction
+        self._names = []
+        self._leases = {}
+        self._priorities = {}
+        self._index_lock = threading.Lock()
+        # lease deadlines by unleased file name of the blobs leased while
+        # the directory is owned, which are not renamed
+        self._holds = {}
+        self._pass = None
+        self._maintenance_lock = threading.Lock()
+        # set once the first maintenance pass found the blobs left on disk
+        self._ready = threading.Event()
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except Exception:
+            pass  # keep silent
+        # whether this instance owns the directory, holding the advisory
+        # lock of its owner file
+        self.exclusive = False
+        self._owner_file = None
+        if exclusive:
+            self.exclusive = self._claim()
+        self._maintenance_task = _MaintenanceTask(
             interval=self.maintenance_period,
             function=self._maintenance_routine,
         )
@@ -100,8 +554,15 @@ class LocalFileStorage:
         self._maintenance_task.start()
 
     def close(self):
+        with self._group_lock:
+            group = self._group
+        if group is not None:
+            self._commit(group)
         self._maintenance_task.cancel()
         self._maintenance_task.join()
+        if self._owner_file is not None:
+            self._owner_file.close()
+            self._owner_file = None
 
     def __enter__(self):
         return self
@@ -110,52 +571,214 @@ class LocalFileStorage:
     def __exit__(self, type, value, traceback):
         self.close()
 
-    # pylint: disable=unused-variable
+    def _claim(self):
+        """Takes ownership of the storage directory, returns whether it did.
+
+        The owner keeps the leases of its blobs in memory instead of
+        renaming their files; every process sharing the directory has to
+        ask for ownership so that they do not send the same blobs.
+        """
+        if fcntl is None:
+            logger.warning(
+                "Local storage %s cannot be owned on this platform, blobs "
+                "are leased through the file system.",
+                self.path,
+            )
+            return False
+        self._owner_file = _claim_directory(self.path)
+        if self._owner_file is None:
+            logger.warning(
+                "Local storage %s is owned by another process, blobs are "
+                "leased through the file system.",
+                self.path,
+            )
+            return False
+        return True
+
     def _maintenance_routine(self):
+        """Runs a maintenance tick, returns whether it completed a pass.
+
+        A tick goes through at most ``maintenance_batch`` files of the
+        storage directory; it removes abandoned temporary files and expired
+        blobs, releases expired leases and brings the blob index and the
+        storage size in line with the disk. A pass covers the whole
+        directory over one or more ticks.
+        """
+        with self._maintenance_lock:
+            started = time.monotonic()
+            # the constructor created the directory right before the first
+            # pass, later passes create it again if it has been removed
+            try:
+                if self._ready.is_set() and not os.path.isdir(self.path):
+                    os.makedirs(self.path, exist_ok=True)
+            except Exception:
+                pass  # keep silent
+            try:
+                if self._pass is None:
+                    # a put that does not see the pass is counted by it
+                    with self._size_lock:
+                        self._pass = _MaintenancePass(self.path)
+            except Exception:
+                self._ready.set()
+                return True  # keep silent
+            scan = self._pass
+            count = 0
+            try:
+                for entry in itertools.islice(
+                    scan.entries, self.maintenance_batch
+                ):
+                    count += 1
+                    try:
+                        self._maintain(entry, scan)
+                    except Exception:
+                        pass  # keep silent
+            except Exception:
+                # the directory cannot be listed any more, start over
+                self._pass = None
+                return True  # keep silent
+            scan.duration += time.monotonic() - started
+            if count == self.maintenance_batch:
+                return False
+            self._end_pass()
+            self.maintenance_duration = scan.duration
+            logger.debug(
+                "Local storage maintenance pass over %d files took %.3f "
+                "seconds.",
+                scan.files,
+                scan.duration,
+            )
+            self._ready.set()
+            return True
+
+    def _maintain(self, entry, scan):
+        now = _now()
+        name = entry.name
+        path = entry.path
         try:
-            if not os.path.isdir(self.path):
-                os.makedirs(self.path, exist_ok=True)
-        except Exception:
-            pass  # keep silent
+            # skip if not a file or symbolic link
+            if not entry.is_file(follow_symlinks=False):
+                return
+            size = entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            return  # removed since the directory was listed
+        scan.files += 1
+        if name.endswith(".tmp"):
+            timeout_deadline = _fmt(now - _seconds(self.write_timeout))
+            if name < timeout_deadline and not _is_locked(path):
+                os.remove(path)  # TODO: log data loss
+                return
+        base, lease = _split_lease(name)
+        if base.endswith(_BLOB_EXTENSIONS):
+            if lease is not None and lease <= _fmt(now):
+                base_path = os.path.join(self.path, base)
+                if not _is_locked(path):
+                    os.rename(path, base_path)
+                    path = base_path
+                    lease = None
+            if lease is None:
+                retention_deadline = _fmt(
+                    now - _seconds(self.retention_period)
+                )
+                if base < retention_deadline:
+                    os.remove(path)  # TODO: log data loss
+                    self._untrack(base)
+                    return
+        with self._size_lock:
+            if base in scan.removed or base in self._writing:
+                return
+            if base.endswith(_BLOB_EXTENSIONS):
+                self._track(path)
+            # files created during the pass are counted by put
+            if base < scan.started and base not in scan.seen:
+                scan.seen.add(base)
+                scan.size += size
+
+    def _end_pass(self):
+        scan = self._pass
         try:
-            # pylint: disable=unused-variable
-            for blob in self.gets():
-                pass  # keep silent
+            scan.entries.close()
         except Exception:
             pass  # keep silent
+        # forget the blobs removed by other processes
+        with self._index_lock:
+            names = [
+                name
+                for name in self._names
+                if name < scan.started and name not in scan.seen
+            ]
+        for name in names:
+            self._untrack(name)
+        with self._size_lock:
+            self._pass = None
+            self._size = scan.size
+
+    def _track(self, path):
+        name, lease = _split_lease(os.path.basename(path))
+        with self._index_lock:
+            if name not in self._leases:
+                bisect.insort(self._names, name)
+                bisect.insort(
+                    self._priorities.setdefault(_name_priority(name), []), name
+                )
+            self._leases[name] = lease
+
+    def _untrack(self, path):
+        name, _ = _split_lease(os.path.basename(path))
+        with self._index_lock:
+            self._holds.pop(name, None)
+            if self._leases.pop(name, False) is not False:
+                del self._names[bisect.bisect_left(self._names, name)]
+                names = self._priorities[_name_priority(name)]
+                del names[bisect.bisect_left(names, name)]
+
+    def _hold(self, blob, period):
+        """Leases a blob in memory, returns whether it could.
+
+        Fails if the blob has been deleted, or leased by someone else since
+        it was handed out.
+        """
+        name, _ = _split_lease(os.path.basename(blob.fullpath))
+        lease = _fmt(_now() + _seconds(period))
+        with self._index_lock:
+            # pylint: disable=protected-access
+            if name not in self._leases or self._holds.get(name) != blob._held:
+                return False
+            self._holds[name] = lease
+            blob._held = lease
+        return True
 
     def gets(self):
         now = _now()
         lease_deadline = _fmt(now)
         retention_deadline = _fmt(now - _seconds(self.retention_period))
-        timeout_deadline = _fmt(now - _seconds(self.write_timeout))
-        for name in sorted(os.listdir(self.path)):
+        with self._index_lock:
+            entries = [
+                (name, self._leases[name], self._holds.get(name))
+                for name in self._names
+            ]
+        for name, lease, hold in entries:
+            if hold is not None and hold > lease_deadline:
+                continue  # under lease, kept in memory
             path = os.path.join(self.path, name)
-            if not os.path.isfile(path):
-                continue  # skip if not a file
-            if path.endswith(".tmp"):
-                if name < timeout_deadline:
-                    try:
-                        os.remove(path)  # TODO: log data loss
-                    except Exception:
-                        pass  # keep silent
-            if path.endswith(".lock"):
-                if path[path.rindex("@") + 1 : -5] > lease_deadline:
+            if lease is not None:
+                if lease > lease_deadline:
                     continue  # under lease
-                new_path = path[: path.rindex("@")]
+                lease_path = path + "@{}.lock".format(lease)
+                if _is_locked(lease_path):
+                    continue  # lease expired but still being sent
                 try:
-                    os.rename(path, new_path)
+                    os.rename(lease_path, path)
                 except Exception:
                     continue  # keep silent
-                path = new_path
-            if path.endswith(".blob"):
-                if name < retention_deadline:
-                    try:
-                        os.remove(path)  # TODO: log data loss
-                    except Exception:
-                        pass  # keep silent
-                else:
-                    yield LocalFileBlob(path)
+                self._track(path)
+            if name < retention_deadline:
+                self._remove(path)  # TODO: log data loss
+            elif os.path.isfile(path):
+                blob = LocalFileBlob(path, storage=self)
+                blob._held = hold  # pylint: disable=protected-access
+                yield blob
+            else:
+                self._untrack(path)  # deleted by another process
 
     def get(self):
         cursor = self.gets()
@@ -166,46 +789,204 @@ class LocalFileStorage:
         return None
 
     def put(self, data, lease_period=0):
+        priority = None
+        if self.eviction_policy == DROP_LOWEST_PRIORITY:
+            data = list(data)
+            priority = max(map(_item_priority, data), default=0)
+        if self.eviction_policy != DROP_NEWEST:
+            self._evict(priority)
         if not self._check_storage_size():
             return None
+        if self.commit_interval > 0 and self.durability != DURABILITY_PUT:
+            return self._put_group(data, lease_period, priority)
         blob = LocalFileBlob(
             os.path.join(
                 self.path,
-                "{}-{}.blob".format(
-                    _fmt(_now()),
-                    "{:08x}".format(
-                        random.getrandbits(32)
-                    ),  # thread-safe random
-                ),
+                _new_name(_BLOB_EXTENSIONS[self.compress], priority),
+            ),
+            storage=self,
+        )
+        try:
+            return self._write(
+                blob,
+                data,
+                lease_period=lease_period,
+                fsync=self.durability != DURABILITY_NONE,
             )
+        except Exception:
+            return None  # keep silent
+
+    def _put_group(self, data, lease_period, priority):
+        """Gathers a batch with the others put within the commit interval.
+
+        The batches are written to a single blob once the interval is over
+        or once they reach ``commit_size`` bytes. The blob is returned
+        right away, and can only be used once written: until then its
+        ``fullpath`` is None, get returns None, lease returns None and delete
+        does nothing. With the "group" durability the put waits for it to be
+        written and synced, and returns None if that takes longer than
+        ``write_timeout`` seconds.
+        """
+        items = [
+            item if isinstance(item, bytes) else serialization.dumps(item)
+            for item in data
+        ]
+        lease = None
+        if lease_period:
+            lease = _now() + _seconds(lease_period)
+        with self._group_lock:
+            group = self._group
+            if group is None:
+                group = self._group = _CommitGroup(
+                    LocalFileBlob(None, storage=self)
+                )
+                group.timer = threading.Timer(
+                    self.commit_interval, self._commit, (group,)
+                )
+                group.timer.daemon = True
+                group.timer.start()
+            group.items.extend(items)
+            group.batches += 1
+            group.size += sum(len(item) + 1 for item in items)
+            if lease is not None and (
+                group.lease is None or lease > group.lease
+            ):
+                group.lease = lease
+            if priority is not None:
+                group.priority = max(group.priority or 0, priority)
+            full = group.size >= self.commit_size
+        if full:
+            self._commit(group)
+        if self.durability == DURABILITY_GROUP and not group.done.wait(
+            self.write_timeout
+        ):
+            return None
+        return group.blob
+
+    def _commit(self, group):
+        """Writes the batches of a group to its blob, once."""
+        with self._group_lock:
+            if self._group is not group:
+                return  # already written
+            self._group = None
+        group.timer.cancel()
+        blob = group.blob
+        blob.fullpath = os.path.join(
+            self.path,
+            _new_name(_BLOB_EXTENSIONS[self.compress], group.priority),
         )
-        return blob.put(data, lease_period=lease_period)
+        lease_period = 0
+        if group.lease is not None:
+            lease_period = max((group.lease - _now()).total_seconds(), 0)
+        try:
+            self._write(
+                blob,
+                group.items,
+                lease_period=lease_period,
+                fsync=self.durability == DURABILITY_GROUP,
+            )
+        except Exception as ex:
+            logger.warning(
+                "Failed to write %d batches to local storage, they are "
+                "lost: %s",
+                group.batches,
+                ex,
+            )
+            blob.fullpath = None
+            group.blob = None
+        group.done.set()
+
+    def _write(self, blob, data, lease_period, fsync):
+        """Writes a blob and accounts for it, raises if it cannot."""
+        name = os.path.basename(blob.fullpath)
+        with self._size_lock:
+            self._writing.add(name)
+        try:
+            # pylint: disable=protected-access
+            blob._write(data, lease_period, fsync)
+            self._add(blob)
+            return blob
+        finally:
+            with self._size_lock:
+                self._writing.discard(name)
+
+    def _add(self, blob):
+        """Accounts for a blob that has just been written."""
+        try:
+            self._update_size(
+                os.path.getsize(blob.fullpath), os.path.basename(blob.fullpath)
+            )
+        except OSError:
+            logger.error(
+                "Path %s does not exist or is inaccessible.", blob.fullpath
+            )
+        self._track(blob.fullpath)
+
+    def _evict(self, priority=None):
+        """Removes stored blobs until the storage is no longer full.
+
+        The oldest blobs go first. With a priority, only blobs with a lower
+        or the same priority are removed, the lowest first.
+        """
+        while self._used_size() >= self.max_size:
+            with self._index_lock:
+                name = None
+                if priority is None:
+                    name = self._names[0] if self._names else None
+                else:
+                    for key in sorted(self._priorities):
+                        if key <= priority and self._priorities[key]:
+                            name = self._priorities[key][0]
+                            break
+                lease = self._leases.get(name)
+            if name is None:
+                return
+            path = os.path.join(self.path, name)
+            if lease is not None:
+                path += "@{}.lock".format(lease)
+            logger.warning(
+                "Persistent storage max capacity has been reached, "
+                "dropping stored telemetry %s.",
+                name,
+            )
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except Exception:
+            pass  # keep silent
+        else:
+            self._update_size(-size, os.path.basename(path))
+        # untracked last, so that a pass in progress cannot track it again
+        self._untrack(path)
+
+    def _update_size(self, delta, name=None):
+        with self._size_lock:
+            self._size = max(self._size + delta, 0)
+            scan = self._pass
+            if scan is not None and name is not None:
+                # keep the size computed by the pass in progress accurate
+                name, _ = _split_lease(name)
+                if name >= scan.started:
+                    scan.size += delta
+                elif delta > 0:
+                    # written before the pass started, counted unless the
+                    # pass already listed it
+                    if name not in scan.seen:
+                        scan.seen.add(name)
+                        scan.size += delta
+                elif name in scan.seen:
+                    scan.size += delta
+                else:
+                    # removed before the pass got to it
+                    scan.removed.add(name)
+
+    def _used_size(self):
+        """Bytes on disk and gathered to be written."""
+        group = self._group
+        return self._size + (0 if group is None else group.size)
 
     def _check_storage_size(self):
-        size = 0
-        # pylint: disable=unused-variable
-        for dirpath, dirnames, filenames in os.walk(self.path):
-            for filename in filenames:
-                path = os.path.join(dirpath, filename)
-                # skip if it is symbolic link
-                if not os.path.islink(path):
-                    try:
-                        size += os.path.getsize(path)
-                    except OSError:
-                        logger.error(
-                            "Path %s does not exist or is " "inaccessible.",
-                            path,
-                        )
-                        continue
-                    if size >= self.max_size:
-                        # pylint: disable=logging-format-interpolation
-                        logger.warning(
-                            "Persistent storage max capacity has been "
-                            "reached. Currently at {}KB. Telemetry will be "
-                            "lost. Please consider increasing the value of "
-                            "'storage_max_size' in exporter config.".format(
-                                str(size / 1024)
-                            )
-                        )
-                        return False
-        return True
+        return not _storage_full(self._used_size(), self.max_size)
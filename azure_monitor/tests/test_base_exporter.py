@@ -1,10 +1,15 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import gzip
 import json
 import os
 import shutil
+import threading
 import unittest
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 from unittest import mock
 
 import requests
@@ -19,6 +24,7 @@ from azure_monitor.export import (
 )
 from azure_monitor.options import ExporterOptions
 from azure_monitor.protocol import Data, Envelope
+from azure_monitor.storage import LocalFileBlob
 
 TEST_FOLDER = os.path.abspath(".test")
 STORAGE_PATH = os.path.join(TEST_FOLDER)
@@ -41,6 +47,67 @@ def throw(exc_type, *args, **kwargs):
     return func
 
 
+class IngestionHandler(BaseHTTPRequestHandler):
+    """Stand-in for the ingestion service, keeps connections alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    # pylint: disable=invalid-name
+    def do_POST(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            length = int(self.rfile.readline(), 16)
+            while length:
+                body += self.rfile.read(length)
+                self.rfile.readline()
+                length = int(self.rfile.readline(), 16)
+            self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append((dict(self.headers), body))
+        self.server.connections.add(self.client_address)
+        body = b'{"itemsReceived": 1, "itemsAccepted": 1, "errors": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # pylint: disable=arguments-differ
+    def log_message(self, *args):
+        pass  # keep silent
+
+
+class IngestionServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), IngestionHandler)
+        self.connections = set()
+        self.received = []
+        self._thread = threading.Thread(
+            target=self.serve_forever, kwargs={"poll_interval": 0.05}
+        )
+        self._thread.daemon = True
+
+    @property
+    def connection_string(self):
+        return (
+            "InstrumentationKey=1234abcd-5678-4efa-8abc-1234567890ab;"
+            "IngestionEndpoint=http://{}:{}".format(*self.server_address)
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    # pylint: disable=redefined-builtin
+    def __exit__(self, type, value, traceback):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+
 # pylint: disable=W0212
 # pylint: disable=R0904
 class TestBaseExporter(unittest.TestCase):
@@ -67,6 +134,8 @@ class TestBaseExporter(unittest.TestCase):
         """Test the constructor."""
         base = BaseExporter(
             instrumentation_key="4321abcd-5678-4efa-8abc-1234567890ab",
+            connection_idle_timeout=6,
+            connection_pool_size=7,
             proxies={"https": "https://test-proxy.com"},
             storage_maintenance_period=2,
             storage_max_size=3,
@@ -82,6 +151,8 @@ class TestBaseExporter(unittest.TestCase):
         self.assertEqual(
             base.options.proxies, {"https": "https://test-proxy.com"}
         )
+        self.assertEqual(base.options.connection_idle_timeout, 6)
+        self.assertEqual(base.options.connection_pool_size, 7)
         self.assertEqual(base.options.storage_maintenance_period, 2)
         self.assertEqual(base.options.storage_max_size, 3)
         self.assertEqual(base.options.storage_retention_period, 4)
@@ -166,7 +237,7 @@ class TestBaseExporter(unittest.TestCase):
         exporter = BaseExporter(
             storage_path=os.path.join(TEST_FOLDER, self.id())
         )
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = None
             exporter._transmit_from_storage()
 
@@ -176,7 +247,7 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post", throw(requests.Timeout)):
+        with mock.patch("requests.Session.post", throw(requests.Timeout)):
             exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
         self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
@@ -187,12 +258,12 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post", throw(Exception)):
+        with mock.patch("requests.Session.post", throw(Exception)):
             exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
         self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
 
-    @mock.patch("requests.post", return_value=mock.Mock())
+    @mock.patch("requests.Session.post", return_value=mock.Mock())
     def test_transmission_lease_failure(self, requests_mock):
         requests_mock.return_value = MockResponse(200, "unknown")
         exporter = BaseExporter(
@@ -213,7 +284,7 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(200, None)
             del post.return_value.text
             exporter._transmit_from_storage()
@@ -226,19 +297,35 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(200, "unknown")
             exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
         self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
 
+    def test_transmission_stored_bytes(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id())
+        )
+        exporter.storage.put([b'{"name": "a"}', b'{"name": "b"}'])
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(200, "unknown")
+            with mock.patch(
+                "azure_monitor.serialization.loads", throw(ValueError)
+            ):
+                exporter._transmit_from_storage()
+        self.assertEqual(
+            post.call_args[1]["data"], b'[{"name": "a"},{"name": "b"}]'
+        )
+        self.assertIsNone(exporter.storage.get())
+
     def test_transmission_206(self):
         exporter = BaseExporter(
             storage_path=os.path.join(TEST_FOLDER, self.id())
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(206, "unknown")
             exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
@@ -254,7 +341,7 @@ class TestBaseExporter(unittest.TestCase):
             tuple([Envelope(), Envelope(), test_envelope]),
         )
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(
                 206,
                 json.dumps(
@@ -284,7 +371,7 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(
                 206,
                 json.dumps(
@@ -306,7 +393,7 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(
                 206,
                 json.dumps(
@@ -321,13 +408,58 @@ class TestBaseExporter(unittest.TestCase):
         self.assertIsNone(exporter.storage.get())
         self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
 
+    def test_transmission_206_serialized(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id())
+        )
+        envelopes = [b'{"name":  "a"}', b'{"name":  "b"}', b'{"name":  "c"}']
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(
+                206,
+                json.dumps(
+                    {
+                        "itemsReceived": 3,
+                        "itemsAccepted": 1,
+                        "errors": [
+                            {"index": 0, "statusCode": 400, "message": ""},
+                            {"index": 2, "statusCode": 429, "message": ""},
+                        ],
+                    }
+                ),
+            )
+            with mock.patch("json.dumps") as dumps:
+                result = exporter._transmit(envelopes)
+                self.assertFalse(dumps.called)
+        self.assertEqual(result, ExportResult.FAILED_NOT_RETRYABLE)
+        files = os.listdir(exporter.storage.path)
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(exporter.storage.path, files[0])) as file:
+            self.assertEqual(file.read(), '{"name":  "c"}\n')
+        self.assertEqual(exporter.statistics.retried, {429: 1})
+        self.assertEqual(exporter.statistics.dropped, {400: 1})
+
+    def test_transmission_status_statistics(self):
+        exporter = BaseExporter(
+            retry_initial_delay=0,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        envelopes = [Envelope().to_dict(), Envelope().to_dict()]
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(400, "{}")
+            exporter._transmit(envelopes)
+            post.return_value = MockResponse(500, "{}")
+            exporter._transmit(envelopes)
+            exporter._transmit(envelopes)
+        self.assertEqual(exporter.statistics.dropped, {400: 2})
+        self.assertEqual(exporter.statistics.retried, {500: 4})
+
     def test_transmission_400(self):
         exporter = BaseExporter(
             storage_path=os.path.join(TEST_FOLDER, self.id())
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(400, "{}")
             exporter._transmit_from_storage()
         self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
@@ -338,7 +470,7 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(439, "{}")
             exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
@@ -350,7 +482,7 @@ class TestBaseExporter(unittest.TestCase):
         )
         envelopes_to_export = map(lambda x: x.to_dict(), tuple([Envelope()]))
         exporter.storage.put(envelopes_to_export)
-        with mock.patch("requests.post") as post:
+        with mock.patch("requests.Session.post") as post:
             post.return_value = MockResponse(500, "{}")
             exporter._transmit_from_storage()
         self.assertIsNone(exporter.storage.get())
@@ -363,6 +495,431 @@ class TestBaseExporter(unittest.TestCase):
         status = exporter._transmit([])
         self.assertEqual(status, ExportResult.SUCCESS)
 
+    def test_transmission_reuses_connection(self):
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            for _ in range(3):
+                result = exporter._transmit([Envelope().to_dict()])
+                self.assertEqual(result, ExportResult.SUCCESS)
+            exporter.shutdown()
+        self.assertEqual(len(server.received), 3)
+        self.assertEqual(len(server.connections), 1)
+
+    def test_transmission_idle_eviction(self):
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                connection_idle_timeout=0,
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            for _ in range(2):
+                result = exporter._transmit([Envelope().to_dict()])
+                self.assertEqual(result, ExportResult.SUCCESS)
+            exporter.shutdown()
+        self.assertEqual(len(server.connections), 2)
+
+    def test_transmission_gzip(self):
+        envelopes = [Envelope(name="testEnvelope").to_dict()] * 10
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                compression="gzip",
+                compression_min_size=0,
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            result = exporter._transmit(envelopes)
+            exporter.shutdown()
+        self.assertEqual(result, ExportResult.SUCCESS)
+        headers, body = server.received[0]
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(body)), envelopes)
+        stats = exporter.statistics
+        self.assertEqual(stats.requests, 1)
+        self.assertEqual(stats.last_sent_bytes, len(body))
+        self.assertLess(stats.last_sent_bytes, stats.last_raw_bytes)
+
+    def test_transmission_deflate(self):
+        envelopes = [Envelope(name="testEnvelope").to_dict()] * 10
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                compression="deflate",
+                compression_min_size=0,
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            exporter._transmit(envelopes)
+            exporter.shutdown()
+        headers, body = server.received[0]
+        self.assertEqual(headers["Content-Encoding"], "deflate")
+        self.assertEqual(json.loads(zlib.decompress(body)), envelopes)
+
+    def test_transmission_compression_min_size(self):
+        envelopes = [Envelope().to_dict()]
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                compression="gzip",
+                compression_min_size=1024 * 1024,
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            exporter._transmit(envelopes)
+            exporter.shutdown()
+        headers, body = server.received[0]
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(json.loads(body), envelopes)
+        self.assertEqual(
+            exporter.statistics.last_sent_bytes,
+            exporter.statistics.last_raw_bytes,
+        )
+
+    def test_submit_sync(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id())
+        )
+        with mock.patch.object(exporter, "_transmit") as transmit:
+            transmit.return_value = ExportResult.FAILED_RETRYABLE
+            result = exporter._submit([Envelope().to_dict()])
+        self.assertEqual(result, ExportResult.FAILED_RETRYABLE)
+        self.assertIsNone(exporter.storage.get())
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        self.assertTrue(exporter.flush())
+
+    def test_submit_async(self):
+        exporter = BaseExporter(
+            async_export=True,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        with mock.patch.object(exporter, "_transmit") as transmit:
+            transmit.return_value = ExportResult.FAILED_RETRYABLE
+            result = exporter._submit([Envelope().to_dict()])
+            self.assertEqual(result, ExportResult.SUCCESS)
+            self.assertTrue(exporter.flush(5))
+            self.assertEqual(transmit.call_count, 1)
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        exporter.shutdown()
+        self.assertFalse(exporter._worker.is_alive())
+
+    def test_submit_async_shutdown_stores(self):
+        exporter = BaseExporter(
+            async_export=True,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+            timeout=0.01,
+        )
+        sending = threading.Event()
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+
+        def transmit(batch):
+            sending.set()
+            gate.wait(5)
+            return ExportResult.SUCCESS
+
+        with mock.patch.object(exporter, "_transmit", transmit):
+            exporter._submit([Envelope(name="sent").to_dict()])
+            self.assertTrue(sending.wait(5))
+            exporter._submit([Envelope(name="queued").to_dict()])
+            with self.assertLogs("azure_monitor.export", "WARNING"):
+                exporter.shutdown()
+            blobs = list(exporter.storage.gets())
+            self.assertEqual(len(blobs), 1)
+            self.assertEqual(blobs[0].get()[0]["name"], "queued")
+            gate.set()
+            exporter._worker.join(5)
+
+    def test_submit_async_queue_full(self):
+        exporter = BaseExporter(
+            async_export=True,
+            export_queue_policy="drop_newest",
+            export_queue_size=1,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        exporter.shutdown()
+        result = exporter._submit([Envelope().to_dict()])
+        self.assertEqual(result, ExportResult.FAILED_NOT_RETRYABLE)
+
+    def test_transmission_concurrent(self):
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                connection_string=server.connection_string,
+                storage_drain_concurrency=4,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            for i in range(10):
+                exporter.storage.put([Envelope(name=str(i)).to_dict()])
+            exporter._transmit_from_storage()
+            exporter.shutdown()
+        self.assertEqual(len(server.received), 10)
+        self.assertLessEqual(len(server.connections), 4)
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 0)
+
+    def test_transmission_concurrent_throttled(self):
+        exporter = BaseExporter(
+            storage_drain_concurrency=2,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        for i in range(6):
+            exporter.storage.put([Envelope(name=str(i)).to_dict()])
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(429, "{}")
+            exporter._transmit_from_storage()
+        self.assertLessEqual(post.call_count, 2)
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 6)
+
+    def test_transmission_concurrent_exception(self):
+        exporter = BaseExporter(
+            storage_drain_concurrency=2,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        self.addCleanup(exporter.shutdown)
+        exporter.storage.put([Envelope().to_dict()])
+        with mock.patch.object(
+            exporter, "_transmit_blob", throw(ValueError)
+        ), self.assertLogs("azure_monitor.export", "ERROR") as logs:
+            exporter._transmit_from_storage()
+        self.assertIn("ValueError", logs.output[0])
+
+    def test_transmission_throttled(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id())
+        )
+        for i in range(3):
+            exporter.storage.put([Envelope(name=str(i)).to_dict()])
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(439, "{}")
+            exporter._transmit_from_storage()
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 3)
+
+    def test_transmission_chunked(self):
+        envelopes = [Envelope(name=str(i)).to_dict() for i in range(3)]
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                chunked_upload=True,
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            result = exporter._transmit(envelopes)
+            exporter.shutdown()
+        self.assertEqual(result, ExportResult.SUCCESS)
+        headers, body = server.received[0]
+        self.assertEqual(headers["Transfer-Encoding"], "chunked")
+        self.assertEqual(json.loads(body), envelopes)
+        self.assertEqual(exporter.statistics.last_raw_bytes, len(body))
+        self.assertEqual(exporter.statistics.last_sent_bytes, len(body))
+
+    def test_transmission_chunked_gzip(self):
+        envelopes = [Envelope(name=str(i)).to_dict() for i in range(100)]
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                chunked_upload=True,
+                compression="gzip",
+                compression_min_size=0,
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            exporter._transmit(envelopes)
+            exporter.shutdown()
+        headers, body = server.received[0]
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(body)), envelopes)
+        self.assertEqual(exporter.statistics.last_sent_bytes, len(body))
+
+    def test_transmission_chunked_deflate(self):
+        envelopes = [Envelope(name=str(i)).to_dict() for i in range(3)]
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                chunked_upload=True,
+                compression="deflate",
+                compression_min_size=0,
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            exporter._transmit(envelopes)
+            exporter.shutdown()
+        _, body = server.received[0]
+        self.assertEqual(json.loads(zlib.decompress(body)), envelopes)
+
+    def test_transmission_envelope_objects(self):
+        envelopes = [Envelope(name="a"), Envelope(name="b")]
+        with IngestionServer() as server:
+            exporter = BaseExporter(
+                connection_string=server.connection_string,
+                storage_path=os.path.join(TEST_FOLDER, self.id()),
+            )
+            exporter._export(envelopes)
+            exporter.shutdown()
+        _, body = server.received[0]
+        self.assertEqual(json.loads(body), [x.to_dict() for x in envelopes])
+
+    def test_split_batches_items(self):
+        exporter = BaseExporter(
+            max_batch_items=2,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        envelopes = [Envelope(name=str(i)).to_dict() for i in range(5)]
+        batches = list(exporter._split_batches(envelopes))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(
+            json.loads(batches[2][0].decode("utf-8")), envelopes[4]
+        )
+
+    def test_split_batches_size(self):
+        envelopes = [Envelope(name=str(i)).to_dict() for i in range(4)]
+        item_size = len(json.dumps(envelopes[0]))
+        exporter = BaseExporter(
+            # two items, their separator and the enclosing brackets
+            max_batch_size=2 * item_size + 3,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        batches = list(exporter._split_batches(envelopes))
+        self.assertEqual([len(batch) for batch in batches], [2, 2])
+        for batch in batches:
+            payload = b"[" + b",".join(batch) + b"]"
+            self.assertLessEqual(len(payload), exporter.options.max_batch_size)
+
+    def test_split_batches_oversized_item(self):
+        exporter = BaseExporter(
+            max_batch_size=1,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        envelopes = [Envelope().to_dict(), Envelope().to_dict()]
+        batches = list(exporter._split_batches(envelopes))
+        self.assertEqual([len(batch) for batch in batches], [1, 1])
+
+    def test_export_split_partial_failure(self):
+        exporter = BaseExporter(
+            max_batch_items=1,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        envelopes = [Envelope(name=str(i)).to_dict() for i in range(3)]
+        with mock.patch.object(exporter, "_transmit") as transmit:
+            transmit.side_effect = [
+                ExportResult.SUCCESS,
+                ExportResult.FAILED_RETRYABLE,
+                ExportResult.SUCCESS,
+            ]
+            result = exporter._export(envelopes)
+        self.assertEqual(result, ExportResult.FAILED_RETRYABLE)
+        self.assertEqual(transmit.call_count, 3)
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 1)
+        self.assertIsNone(exporter.storage.get())
+
+    def test_transmission_split_partial_failure(self):
+        exporter = BaseExporter(
+            max_batch_items=1,
+            retry_initial_delay=0,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        exporter.storage.put(
+            [Envelope(name=str(i)).to_dict() for i in range(3)]
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.side_effect = [
+                MockResponse(200, "{}"),
+                MockResponse(500, "{}"),
+                MockResponse(200, "{}"),
+            ]
+            exporter._transmit_from_storage()
+        self.assertEqual(post.call_count, 3)
+        files = os.listdir(exporter.storage.path)
+        self.assertEqual(len(files), 1)
+        blob = LocalFileBlob(os.path.join(exporter.storage.path, files[0]))
+        self.assertEqual(blob.get(), (Envelope(name="1").to_dict(),))
+
+    def test_transmission_split_streamed(self):
+        exporter = BaseExporter(
+            max_batch_items=1,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        exporter.storage.put(
+            [Envelope(name=str(i)).to_dict() for i in range(3)]
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(200, "{}")
+            with mock.patch(
+                "azure_monitor.storage.LocalFileBlob.get_raw", throw(Exception)
+            ):
+                exporter._transmit_from_storage()
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(os.listdir(exporter.storage.path), [])
+
+    def test_transmission_split_suspended(self):
+        exporter = BaseExporter(
+            max_batch_items=1,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        exporter.storage.put(
+            [Envelope(name=str(i)).to_dict() for i in range(3)]
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.side_effect = [
+                MockResponse(200, "{}"),
+                MockResponse(503, "{}"),
+            ]
+            exporter._transmit_from_storage()
+        self.assertEqual(post.call_count, 2)
+        blobs = [
+            LocalFileBlob(os.path.join(exporter.storage.path, name))
+            for name in os.listdir(exporter.storage.path)
+        ]
+        self.assertEqual(
+            sorted(blob.get()[0]["name"] for blob in blobs), ["1", "2"]
+        )
+
+    def test_transmission_split_failed_released(self):
+        exporter = BaseExporter(
+            max_batch_items=1,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        exporter.storage.put(
+            [Envelope(name=str(i)).to_dict() for i in range(3)]
+        )
+        iter_raw = LocalFileBlob.iter_raw
+        lease = LocalFileBlob.lease
+        closed = []
+        leased = []
+
+        def iter_raw_tracked(blob):
+            try:
+                yield from iter_raw(blob)
+            finally:
+                closed.append(blob)
+
+        def lease_tracked(blob, period):
+            leased.append(len(closed))
+            return lease(blob, period)
+
+        with mock.patch.object(
+            LocalFileBlob, "iter_raw", iter_raw_tracked
+        ), mock.patch.object(LocalFileBlob, "lease", lease_tracked):
+            with mock.patch("requests.Session.post") as post:
+                post.return_value = MockResponse(503, "{}")
+                exporter._transmit_from_storage()
+        # leased to be sent, then leased again once no longer read
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(leased, [0, 1])
+
+    def test_transmission_split_all_failed(self):
+        exporter = BaseExporter(
+            max_batch_items=1,
+            retry_initial_delay=0,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        exporter.storage.put(
+            [Envelope(name=str(i)).to_dict() for i in range(2)]
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(500, "{}")
+            exporter._transmit_from_storage()
+        self.assertEqual(post.call_count, 2)
+        files = os.listdir(exporter.storage.path)
+        self.assertEqual(len(files), 1)
+        blob = LocalFileBlob(os.path.join(exporter.storage.path, files[0]))
+        self.assertEqual(len(blob.get()), 2)
+
     def test_get_trace_export_result(self):
         self.assertEqual(
             get_trace_export_result(ExportResult.SUCCESS),
@@ -395,6 +952,7 @@ class TestBaseExporter(unittest.TestCase):
 
 
 class MockResponse:
-    def __init__(self, status_code, text):
+    def __init__(self, status_code, text, headers=None):
         self.status_code = status_code
         self.text = text
+        self.headers = headers or {}
@@ -0,0 +1,131 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from azure_monitor.export import BaseExporter, ExportResult
+from azure_monitor.export.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+)
+from azure_monitor.protocol import Envelope
+
+TEST_FOLDER = os.path.abspath(".test")
+
+
+# pylint: disable=invalid-name
+def setUpModule():
+    os.makedirs(TEST_FOLDER)
+
+
+# pylint: disable=invalid-name
+def tearDownModule():
+    shutil.rmtree(TEST_FOLDER)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_closed(self):
+        breaker = CircuitBreaker(failure_threshold=3)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow_request())
+
+    def test_open(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow_request())
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+
+    @mock.patch("time.monotonic")
+    def test_half_open_single_probe(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        monotonic.return_value = 130
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.is_open())
+        self.assertTrue(breaker.allow_request())
+        self.assertTrue(breaker.is_open())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    @mock.patch("time.monotonic")
+    def test_half_open_probe_failure(self, monotonic):
+        monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+        monotonic.return_value = 130
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        monotonic.return_value = 159
+        self.assertFalse(breaker.allow_request())
+        monotonic.return_value = 160
+        self.assertTrue(breaker.allow_request())
+
+
+# pylint: disable=protected-access
+class TestCircuitBreakerExporter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ[
+            "APPINSIGHTS_INSTRUMENTATIONKEY"
+        ] = "1234abcd-5678-4efa-8abc-1234567890ab"
+
+    def test_transmission_circuit_open(self):
+        exporter = BaseExporter(
+            circuit_breaker_threshold=2,
+            retry_initial_delay=0,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(503, "{}")
+            for _ in range(2):
+                exporter._export([Envelope().to_dict()])
+            self.assertEqual(exporter.circuit_breaker.state, "open")
+            result = exporter._export([Envelope().to_dict()])
+        self.assertEqual(result, ExportResult.FAILED_RETRYABLE)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 3)
+
+    def test_transmission_circuit_probe(self):
+        exporter = BaseExporter(
+            circuit_breaker_reset_timeout=10,
+            circuit_breaker_threshold=1,
+            retry_initial_delay=0,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(503, "{}")
+            exporter._transmit([Envelope().to_dict()])
+            self.assertEqual(exporter.circuit_breaker.state, "open")
+            exporter.circuit_breaker._opened_at -= 10
+            self.assertEqual(exporter.circuit_breaker.state, "half_open")
+            post.return_value = MockResponse(400, "{}")
+            exporter._transmit([Envelope().to_dict()])
+        self.assertEqual(exporter.circuit_breaker.state, "closed")
+
+
+class MockResponse:
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
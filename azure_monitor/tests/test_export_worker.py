@@ -0,0 +1,98 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import threading
+import unittest
+
+from azure_monitor.export.worker import (
+    BLOCK,
+    DROP_NEWEST,
+    DROP_OLDEST,
+    ExportWorker,
+)
+
+
+class TestExportWorker(unittest.TestCase):
+    def setUp(self):
+        self._sent = []
+        self._gate = threading.Event()
+
+    def _send(self, batch):
+        self._gate.wait()
+        self._sent.append(batch)
+
+    def _worker(self, policy, max_size=2):
+        worker = ExportWorker(
+            self._send, max_size=max_size, policy=policy, block_timeout=0.01
+        )
+        worker.start()
+        self.addCleanup(worker.stop, 1)
+        self.addCleanup(self._gate.set)
+        # occupy the worker so that following batches stay queued
+        worker.put(0)
+        while len(worker):
+            pass
+        return worker
+
+    def test_put_and_flush(self):
+        worker = self._worker(DROP_OLDEST)
+        self.assertTrue(worker.put(1))
+        self.assertTrue(worker.put(2))
+        self._gate.set()
+        self.assertTrue(worker.flush(1))
+        self.assertEqual(self._sent, [0, 1, 2])
+        self.assertEqual(worker.dropped, 0)
+
+    def test_drop_oldest(self):
+        worker = self._worker(DROP_OLDEST)
+        for i in range(1, 5):
+            self.assertTrue(worker.put(i))
+        self._gate.set()
+        worker.flush(1)
+        self.assertEqual(self._sent, [0, 3, 4])
+        self.assertEqual(worker.dropped, 2)
+
+    def test_drop_newest(self):
+        worker = self._worker(DROP_NEWEST)
+        self.assertTrue(worker.put(1))
+        self.assertTrue(worker.put(2))
+        self.assertFalse(worker.put(3))
+        self._gate.set()
+        worker.flush(1)
+        self.assertEqual(self._sent, [0, 1, 2])
+        self.assertEqual(worker.dropped, 1)
+
+    def test_block_timeout(self):
+        worker = self._worker(BLOCK, max_size=1)
+        self.assertTrue(worker.put(1))
+        self.assertFalse(worker.put(2))
+        self.assertEqual(worker.dropped, 1)
+        self._gate.set()
+        worker.flush(1)
+        self.assertEqual(self._sent, [0, 1])
+
+    def test_stop(self):
+        worker = self._worker(DROP_OLDEST)
+        worker.put(1)
+        self._gate.set()
+        worker.stop(1)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(self._sent, [0, 1])
+        self.assertFalse(worker.put(2))
+
+    def test_stop_timeout(self):
+        worker = self._worker(DROP_OLDEST)
+        worker.put(1)
+        worker.put(2)
+        self.assertEqual(worker.stop(0.01), [1, 2])
+        self.assertEqual(worker.dropped, 0)
+
+    def test_function_exception(self):
+        def fail(batch):
+            raise ValueError(batch)
+
+        worker = ExportWorker(fail, max_size=1)
+        worker.start()
+        worker.put(1)
+        self.assertTrue(worker.flush(1))
+        worker.stop(1)
@@ -0,0 +1,159 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import unittest
+from unittest import mock
+
+from azure_monitor.export import BaseExporter, ExportResult
+from azure_monitor.memory_storage import MemoryStorage, NullStorage
+from azure_monitor.protocol import Envelope
+from azure_monitor.storage import _now, _seconds
+
+
+# pylint: disable=protected-access
+class TestMemoryStorage(unittest.TestCase):
+    def test_put(self):
+        with MemoryStorage() as stor:
+            stor.put((1, 2, 3))
+            self.assertEqual(stor._size, 3)
+            stor.put((b'{"a": 1}', {"b": 2}))
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()],
+                [(1, 2, 3), ({"a": 1}, {"b": 2})],
+            )
+            self.assertEqual(list(stor.get().iter_raw()), [b"1", b"2", b"3"])
+
+    def test_lease(self):
+        with MemoryStorage() as stor:
+            stor.put((1, 2, 3), lease_period=10)
+            self.assertIsNone(stor.get())
+            stor.put((4, 5, 6))
+            blob = stor.get()
+            other = stor.get()
+            self.assertIs(blob.lease(10), blob)
+            self.assertIsNone(other.lease(10))
+            self.assertIsNone(stor.get())
+            self.assertIs(blob.lease(0.01), blob)
+            with mock.patch("azure_monitor.memory_storage._now") as m:
+                m.return_value = _now() + _seconds(11)
+                self.assertEqual(
+                    [blob.get() for blob in stor.gets()],
+                    [(1, 2, 3), (4, 5, 6)],
+                )
+
+    def test_delete(self):
+        with MemoryStorage() as stor:
+            first = stor.put((1, 2, 3))
+            second = stor.put((4, 5, 6))
+            second.delete()
+            second.delete()
+            self.assertIsNone(second.get())
+            self.assertIsNone(second.lease(10))
+            self.assertEqual(len(stor._records), 2)
+            first.delete()
+            self.assertEqual(len(stor._records), 0)
+            self.assertIsNone(stor.get())
+            self.assertEqual(stor._size, 0)
+
+    def test_retention(self):
+        with MemoryStorage() as stor:
+            with mock.patch("azure_monitor.memory_storage._now") as m:
+                m.return_value = _now() - _seconds(30 * 24 * 60 * 60)
+                stor.put((1, 2, 3))
+            stor.put((4, 5, 6))
+            self.assertEqual(stor.get().get(), (4, 5, 6))
+            self.assertEqual(len(stor._records), 1)
+
+    def test_max_size(self):
+        with MemoryStorage(max_size=1) as stor:
+            self.assertIsNotNone(stor.put((1, 2, 3)))
+            self.assertIsNone(stor.put((1, 2, 3)))
+            self.assertFalse(stor._check_storage_size())
+
+    def test_evict_oldest(self):
+        with MemoryStorage(max_size=6, eviction_policy="drop_oldest") as stor:
+            stor.put((1, 2, 3))
+            stor.put((4, 5, 6))
+            stor.put((7, 8, 9))
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()], [(4, 5, 6), (7, 8, 9)]
+            )
+
+    def test_evict_lowest_priority(self):
+        def envelope(base_type):
+            return {"data": {"baseType": base_type}}
+
+        with MemoryStorage(
+            max_size=100, eviction_policy="drop_lowest_priority"
+        ) as stor:
+            stor.put([envelope("RequestData")])
+            stor.put([envelope("MetricData")])
+            stor.put([envelope("MessageData")])
+            stor.put([envelope("MessageData")])
+            stor.put([envelope("MetricData"), envelope("ExceptionData")])
+            self.assertEqual(
+                [blob.get()[-1]["data"]["baseType"] for blob in stor.gets()],
+                ["RequestData", "MessageData", "ExceptionData"],
+            )
+            self.assertIsNone(stor.put([envelope("MetricData")]))
+            for blob in stor.gets():
+                blob.delete()
+            self.assertFalse(any(stor._priorities.values()))
+
+    def test_close(self):
+        stor = MemoryStorage()
+        stor.put((1, 2, 3))
+        stor.close()
+        self.assertIsNone(stor.get())
+        self.assertEqual(stor._size, 0)
+
+
+class TestNullStorage(unittest.TestCase):
+    def test_put(self):
+        with NullStorage() as stor:
+            self.assertIsNone(stor.put((1, 2, 3)))
+            self.assertIsNone(stor.get())
+            self.assertEqual(list(stor.gets()), [])
+
+
+# pylint: disable=protected-access
+class TestMemoryStorageExporter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ[
+            "APPINSIGHTS_INSTRUMENTATIONKEY"
+        ] = "1234abcd-5678-4efa-8abc-1234567890ab"
+
+    def test_transmission_memory_storage(self):
+        exporter = BaseExporter(storage_type="memory")
+        self.addCleanup(exporter.shutdown)
+        self.assertIsInstance(exporter.storage, MemoryStorage)
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(500, None)
+            exporter._export([Envelope()])
+        # the retry delay is over
+        exporter._retry.reset()
+        exporter.storage._records[0].lease = None
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(200, None)
+            exporter._transmit_from_storage()
+        self.assertIsNone(exporter.storage.get())
+        self.assertEqual(post.call_count, 1)
+
+    def test_transmission_no_storage(self):
+        exporter = BaseExporter(storage_type="none")
+        self.addCleanup(exporter.shutdown)
+        self.assertIsInstance(exporter.storage, NullStorage)
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(500, None)
+            result = exporter._export([Envelope()])
+        self.assertEqual(result, ExportResult.FAILED_RETRYABLE)
+        self.assertIsNone(exporter.storage.get())
+
+
+class MockResponse:
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
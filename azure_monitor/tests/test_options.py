@@ -284,3 +284,151 @@ class TestOptions(unittest.TestCase):
             instrumentation_key=self._valid_instrumentation_key,
         )
         self.assertEqual(options.endpoint, "https://dc.123/v2/track")
+
+    def test_compression(self):
+        options = ExporterOptions(
+            compression="gzip",
+            compression_level=9,
+            compression_min_size=0,
+            instrumentation_key=self._valid_instrumentation_key,
+        )
+        self.assertEqual(options.compression, "gzip")
+        self.assertEqual(options.compression_level, 9)
+        self.assertEqual(options.compression_min_size, 0)
+
+    def test_invalid_compression(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                compression="br",
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+
+    def test_invalid_compression_level(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                compression="gzip",
+                compression_level=10,
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                compression="gzip",
+                compression_level=0,
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+
+    def test_export_queue(self):
+        options = ExporterOptions(
+            async_export=True,
+            export_queue_policy="block",
+            export_queue_size=5,
+            instrumentation_key=self._valid_instrumentation_key,
+        )
+        self.assertTrue(options.async_export)
+        self.assertEqual(options.export_queue_policy, "block")
+        self.assertEqual(options.export_queue_size, 5)
+
+    def test_invalid_export_queue_policy(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                export_queue_policy="drop_random",
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+
+    def test_invalid_export_queue_size(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                export_queue_size=0,
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+
+    def test_invalid_storage_drain_concurrency(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                instrumentation_key=self._valid_instrumentation_key,
+                storage_drain_concurrency=0,
+            ),
+        )
+
+    def test_invalid_storage_type(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                instrumentation_key=self._valid_instrumentation_key,
+                storage_type="sqlite",
+            ),
+        )
+
+    def test_invalid_storage_eviction_policy(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                instrumentation_key=self._valid_instrumentation_key,
+                storage_eviction_policy="drop_random",
+            ),
+        )
+
+    def test_invalid_storage_durability(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                instrumentation_key=self._valid_instrumentation_key,
+                storage_durability="always",
+            ),
+        )
+
+    def test_invalid_storage_commit_interval(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                instrumentation_key=self._valid_instrumentation_key,
+                storage_commit_interval=-1,
+            ),
+        )
+
+    def test_invalid_circuit_breaker_threshold(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                circuit_breaker_threshold=0,
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+
+    def test_invalid_circuit_breaker_reset_timeout(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                circuit_breaker_reset_timeout=0,
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+
+    def test_invalid_connection_pool_size(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                connection_pool_size=0,
+                instrumentation_key=self._valid_instrumentation_key,
+            ),
+        )
+
+    def test_invalid_max_batch_size(self):
+        self.assertRaises(
+            ValueError,
+            lambda: ExporterOptions(
+                instrumentation_key=self._valid_instrumentation_key,
+                max_batch_size=0,
+            ),
+        )
@@ -11,6 +11,45 @@ class TestProtocol(unittest.TestCase):
         data = protocol.BaseObject()
         self.assertEqual(repr(data), "{}")
 
+    def test_context_tags(self):
+        shared = {"a": "1", "b": "2"}
+        tags = protocol.ContextTags({"c": "3"}, shared)
+        tags["b"] = "4"
+        self.assertEqual(tags["a"], "1")
+        self.assertEqual(tags["b"], "4")
+        self.assertIn("c", tags)
+        self.assertEqual(len(tags), 3)
+        self.assertEqual(shared, {"a": "1", "b": "2"})
+        self.assertEqual(tags.to_dict(), {"a": "1", "b": "4", "c": "3"})
+        self.assertRaises(KeyError, lambda: tags["d"])
+        envelope = protocol.Envelope(tags=tags)
+        self.assertEqual(
+            envelope.to_dict()["tags"], {"a": "1", "b": "4", "c": "3"}
+        )
+
+    def test_context_tags_delete(self):
+        shared = {"a": "1", "b": "2"}
+        tags = protocol.ContextTags({"c": "3"}, shared)
+        tags["b"] = "4"
+        del tags["b"]
+        self.assertNotIn("b", tags)
+        self.assertRaises(KeyError, lambda: tags["b"])
+        self.assertEqual(tags.pop("a"), "1")
+        self.assertNotIn("a", tags)
+        self.assertIsNone(tags.pop("a", None))
+        self.assertEqual(list(tags), ["c"])
+        self.assertEqual(len(tags), 1)
+        self.assertEqual(tags.to_dict(), {"c": "3"})
+        self.assertEqual(shared, {"a": "1", "b": "2"})
+        with self.assertRaises(KeyError):
+            del tags["a"]
+        tags["a"] = "5"
+        self.assertEqual(tags.to_dict(), {"a": "5", "c": "3"})
+        del tags["a"]
+        self.assertEqual(tags.to_dict(), {"c": "3"})
+        other = protocol.ContextTags(None, shared)
+        self.assertEqual(other.to_dict(), shared)
+
     def test_data(self):
         data = protocol.Data()
         self.assertIsNone(data.base_data)
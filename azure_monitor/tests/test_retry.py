@@ -0,0 +1,145 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import datetime
+import email.utils
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from azure_monitor.export import BaseExporter, ExportResult
+from azure_monitor.export.retry import RetryScheduler, parse_retry_after
+from azure_monitor.protocol import Envelope
+
+TEST_FOLDER = os.path.abspath(".test")
+
+
+# pylint: disable=invalid-name
+def setUpModule():
+    os.makedirs(TEST_FOLDER)
+
+
+# pylint: disable=invalid-name
+def tearDownModule():
+    shutil.rmtree(TEST_FOLDER)
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def test_backoff(self):
+        retry = RetryScheduler(initial_delay=1, max_delay=10)
+        self.assertFalse(retry.is_backing_off())
+        delays = []
+        for _ in range(6):
+            delays.append(retry.backoff())
+            retry._retry_at = 0.0  # the delay is over
+        for attempt, delay in enumerate(delays):
+            expected = min(2 ** attempt, 10)
+            self.assertGreaterEqual(delay, expected / 2)
+            self.assertLessEqual(delay, expected)
+        self.assertEqual(retry.failures, 6)
+        retry.backoff()
+        self.assertTrue(retry.is_backing_off())
+        self.assertLessEqual(retry.remaining(), 10)
+
+    def test_backoff_same_window(self):
+        retry = RetryScheduler(initial_delay=1, max_delay=10)
+        delay = retry.backoff()
+        for _ in range(7):
+            self.assertLessEqual(retry.backoff(), delay)
+        self.assertEqual(retry.failures, 1)
+        self.assertGreater(retry.backoff(60), 59)
+        self.assertEqual(retry.failures, 1)
+
+    def test_backoff_jitter(self):
+        retry = RetryScheduler(initial_delay=8)
+        with mock.patch("random.uniform", return_value=0):
+            self.assertEqual(retry.backoff(), 4)
+
+    def test_backoff_retry_after(self):
+        retry = RetryScheduler(initial_delay=1, max_delay=10)
+        self.assertEqual(retry.backoff(60), 60)
+        self.assertGreater(retry.remaining(), 59)
+
+    def test_reset(self):
+        retry = RetryScheduler()
+        retry.backoff()
+        retry.reset()
+        self.assertEqual(retry.failures, 0)
+        self.assertFalse(retry.is_backing_off())
+        self.assertEqual(retry.remaining(), 0)
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+        self.assertEqual(parse_retry_after("-5"), 0)
+
+    def test_http_date(self):
+        date = datetime.datetime.now(
+            datetime.timezone.utc
+        ) + datetime.timedelta(seconds=60)
+        value = email.utils.format_datetime(date, usegmt=True)
+        self.assertTrue(50 < parse_retry_after(value) <= 60)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(""))
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+# pylint: disable=protected-access
+class TestRetryExporter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ[
+            "APPINSIGHTS_INSTRUMENTATIONKEY"
+        ] = "1234abcd-5678-4efa-8abc-1234567890ab"
+
+    def test_transmission_backoff(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id())
+        )
+        for i in range(2):
+            exporter.storage.put([Envelope(name=str(i)).to_dict()])
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(503, "{}")
+            exporter._transmit_from_storage()
+            self.assertEqual(post.call_count, 1)
+            self.assertTrue(exporter._retry.is_backing_off())
+            # neither live sends nor replays reach ingestion
+            result = exporter._export([Envelope(name="2").to_dict()])
+            exporter._transmit_from_storage()
+            self.assertEqual(post.call_count, 1)
+        self.assertEqual(result, ExportResult.FAILED_RETRYABLE)
+        self.assertEqual(len(os.listdir(exporter.storage.path)), 3)
+
+    def test_transmission_retry_after(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id())
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(429, "{}", {"Retry-After": "42"})
+            result = exporter._transmit([Envelope().to_dict()])
+        self.assertEqual(result, ExportResult.FAILED_RETRYABLE)
+        self.assertGreater(exporter._retry.remaining(), 40)
+
+    def test_transmission_backoff_reset(self):
+        exporter = BaseExporter(
+            retry_initial_delay=0,
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+        )
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(500, "{}")
+            exporter._transmit([Envelope().to_dict()])
+            self.assertEqual(exporter._retry.failures, 1)
+            post.return_value = MockResponse(200, "{}")
+            exporter._transmit([Envelope().to_dict()])
+            self.assertEqual(exporter._retry.failures, 0)
+
+
+class MockResponse:
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
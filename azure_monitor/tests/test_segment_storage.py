@@ -0,0 +1,224 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from azure_monitor import storage
+from azure_monitor.export import BaseExporter
+from azure_monitor.protocol import Envelope
+from azure_monitor.segment_storage import SegmentFileStorage
+from azure_monitor.storage import LocalFileStorage, _now, _seconds
+
+TEST_FOLDER = os.path.abspath(".test")
+
+
+# pylint: disable=invalid-name
+def setUpModule():
+    os.makedirs(TEST_FOLDER)
+
+
+# pylint: disable=invalid-name
+def tearDownModule():
+    shutil.rmtree(TEST_FOLDER)
+
+
+def throw(exc_type, *args, **kwargs):
+    def func(*_args, **_kwargs):
+        raise exc_type(*args, **kwargs)
+
+    return func
+
+
+# pylint: disable=protected-access
+class TestSegmentFileStorage(unittest.TestCase):
+    def _segments(self, stor):
+        return sorted(
+            name
+            for name in os.listdir(stor.path)
+            if name.endswith((".seg", ".seg.z"))
+        )
+
+    def test_put(self):
+        with SegmentFileStorage(os.path.join(TEST_FOLDER, "seg")) as stor:
+            stor.put((1, 2, 3))
+            stor.put((b'{"a": 1}', {"b": 2}))
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()],
+                [(1, 2, 3), ({"a": 1}, {"b": 2})],
+            )
+            self.assertEqual(len(self._segments(stor)), 1)
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_owned(self):
+        path = os.path.join(TEST_FOLDER, "seg_owned")
+        with SegmentFileStorage(path) as stor:
+            stor.put((1, 2, 3))
+            self.assertRaises(OSError, lambda: SegmentFileStorage(path))
+            self.assertEqual(stor.get().get(), (1, 2, 3))
+        with SegmentFileStorage(path) as stor:
+            self.assertEqual(stor.get().get(), (1, 2, 3))
+
+    def test_get_raw(self):
+        with SegmentFileStorage(
+            os.path.join(TEST_FOLDER, "seg9"), compress=True
+        ) as stor:
+            blob = stor.put((b'{"a": 1}', b'{"b": 2}'))
+            self.assertEqual(blob.get_raw(), (b'{"a": 1}', b'{"b": 2}'))
+
+    def test_lease(self):
+        with SegmentFileStorage(os.path.join(TEST_FOLDER, "seg2")) as stor:
+            stor.put((1, 2, 3), lease_period=10)
+            self.assertIsNone(stor.get())
+            stor.put((4, 5, 6))
+            blob = stor.get()
+            other = stor.get()
+            self.assertIs(blob.lease(10), blob)
+            self.assertIsNone(other.lease(10))
+            self.assertIsNone(stor.get())
+            self.assertIs(blob.lease(0.01), blob)
+            with mock.patch("azure_monitor.segment_storage._now") as m:
+                m.return_value = _now() + _seconds(1)
+                self.assertEqual(stor.get().get(), (4, 5, 6))
+
+    def test_delete(self):
+        with SegmentFileStorage(
+            os.path.join(TEST_FOLDER, "seg3"), segment_size=1
+        ) as stor:
+            first = stor.put((1, 2, 3))
+            second = stor.put((4, 5, 6))
+            self.assertEqual(len(self._segments(stor)), 2)
+            second.delete()
+            second.delete()
+            self.assertEqual(len(self._segments(stor)), 2)
+            first.delete()
+            self.assertEqual(len(self._segments(stor)), 1)
+            self.assertIsNone(stor.get())
+            self.assertIsNone(first.lease(10))
+            stor._maintenance_routine()
+            self.assertEqual(self._segments(stor), [])
+            self.assertEqual(stor._size, 0)
+
+    def test_recovery(self):
+        path = os.path.join(TEST_FOLDER, "seg4")
+        with SegmentFileStorage(path) as stor:
+            stor.put((1,)).delete()
+            stor.put((2,))
+            stor.put((3,)).delete()
+            segment = self._segments(stor)[0]
+        with open(os.path.join(path, segment), "ab") as file:
+            file.write(b"\x10\x00\x00\x00torn")
+        with SegmentFileStorage(path) as stor:
+            self.assertEqual([blob.get() for blob in stor.gets()], [(2,)])
+            self.assertGreater(stor._size, 0)
+
+    def test_recovery_out_of_order(self):
+        path = os.path.join(TEST_FOLDER, "seg11")
+        with SegmentFileStorage(path) as stor:
+            blobs = [stor.put((i,)) for i in range(8)]
+            for i in (0, 1, 2, 3, 6):
+                blobs[i].delete()
+            # under a long lease, holding the checkpoint back
+            self.assertIs(blobs[4].lease(3600), blobs[4])
+        with SegmentFileStorage(path) as stor:
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()], [(4,), (5,), (7,)]
+            )
+            for blob in stor.gets():
+                blob.delete()
+            self.assertEqual(self._segments(stor), [])
+        self.assertEqual(
+            [name for name in os.listdir(path) if name.endswith(".del")], []
+        )
+
+    def test_compress(self):
+        test_input = ({"name": "test"},) * 100
+        path = os.path.join(TEST_FOLDER, "seg8")
+        with SegmentFileStorage(path, compress=True) as stor:
+            stor.put(test_input)
+            self.assertTrue(self._segments(stor)[0].endswith(".seg.z"))
+            self.assertLess(stor._size, 100)
+        with SegmentFileStorage(path) as stor:
+            stor.put(test_input)
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()], [test_input] * 2
+            )
+
+    def test_retention(self):
+        with SegmentFileStorage(os.path.join(TEST_FOLDER, "seg5")) as stor:
+            with mock.patch("azure_monitor.storage._now") as m:
+                m.return_value = _now() - _seconds(30 * 24 * 60 * 60)
+                stor.put((1, 2, 3))
+            stor._maintenance_routine()
+            self.assertIsNone(stor.get())
+            self.assertEqual(self._segments(stor), [])
+
+    def test_max_size(self):
+        with SegmentFileStorage(os.path.join(TEST_FOLDER, "seg6"), 1) as stor:
+            self.assertIsNotNone(stor.put((1, 2, 3)))
+            self.assertIsNone(stor.put((1, 2, 3)))
+            self.assertFalse(stor._check_storage_size())
+
+    def test_evict_oldest(self):
+        with SegmentFileStorage(
+            os.path.join(TEST_FOLDER, "seg10"),
+            max_size=28,
+            eviction_policy="drop_oldest",
+        ) as stor:
+            stor.put((1, 2, 3))
+            stor._maintenance_routine()  # rotate
+            stor.put((4, 5, 6))
+            stor.put((7, 8, 9))
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()], [(4, 5, 6), (7, 8, 9)]
+            )
+            self.assertEqual(len(self._segments(stor)), 1)
+
+    def test_put_error(self):
+        with SegmentFileStorage(os.path.join(TEST_FOLDER, "seg7")) as stor:
+            with mock.patch("builtins.open", side_effect=throw(OSError)):
+                self.assertIsNone(stor.put((1, 2, 3)))
+            self.assertIsNone(stor.get())
+            self.assertEqual(stor.put((1, 2, 3)).get(), (1, 2, 3))
+
+
+# pylint: disable=protected-access
+class TestSegmentStorageExporter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ[
+            "APPINSIGHTS_INSTRUMENTATIONKEY"
+        ] = "1234abcd-5678-4efa-8abc-1234567890ab"
+
+    def test_transmission_segment_storage(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+            storage_type="segment",
+        )
+        self.addCleanup(exporter.shutdown)
+        self.assertIsInstance(exporter.storage, SegmentFileStorage)
+        exporter.storage.put([Envelope().to_dict()])
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(200, None)
+            exporter._transmit_from_storage()
+        self.assertIsNone(exporter.storage.get())
+        self.assertEqual(post.call_count, 1)
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_segment_storage_shared(self):
+        path = os.path.join(TEST_FOLDER, self.id())
+        exporter = BaseExporter(storage_path=path, storage_type="segment")
+        self.addCleanup(exporter.shutdown)
+        other = BaseExporter(storage_path=path, storage_type="segment")
+        self.addCleanup(other.shutdown)
+        self.assertIsInstance(exporter.storage, SegmentFileStorage)
+        self.assertIsInstance(other.storage, LocalFileStorage)
+
+
+class MockResponse:
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
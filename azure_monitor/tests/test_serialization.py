@@ -0,0 +1,46 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+import json
+import unittest
+
+from azure_monitor import serialization
+from azure_monitor.protocol import Envelope
+
+
+class TestSerialization(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(serialization.set_backend, serialization.get_backend())
+
+    def test_default_backend(self):
+        self.assertEqual(
+            serialization.get_backend(), serialization.available_backends()[0]
+        )
+        self.assertIn("json", serialization.available_backends())
+
+    def test_round_trip(self):
+        envelope = Envelope(name="test", tags={"ai.cloud.role": "ü/x"})
+        envelope = envelope.to_dict()
+        for backend in serialization.available_backends():
+            serialization.set_backend(backend)
+            data = serialization.dumps(envelope)
+            self.assertIsInstance(data, bytes)
+            self.assertNotIn(b"\n", data)
+            self.assertEqual(json.loads(data.decode("utf-8")), envelope)
+            self.assertEqual(serialization.loads(data), envelope)
+            self.assertEqual(
+                serialization.loads(data.decode("utf-8")), envelope
+            )
+
+    def test_unsupported_values(self):
+        value = {"big": 2 ** 70, 1: "int key"}
+        for backend in serialization.available_backends():
+            serialization.set_backend(backend)
+            self.assertEqual(
+                serialization.loads(serialization.dumps(value)),
+                {"big": 2 ** 70, "1": "int key"},
+            )
+
+    def test_set_backend_unknown(self):
+        with self.assertRaises(ValueError):
+            serialization.set_backend("pickle")
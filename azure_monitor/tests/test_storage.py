@@ -1,14 +1,22 @@
 # Copyright (c) Microsoft Corporation. All rights reserved.
 # Licensed under the MIT License.
 
+import gc
+import json
 import os
 import shutil
+import threading
 import unittest
+import warnings
 from unittest import mock
 
+from azure_monitor import serialization, storage
+from azure_monitor.export import BaseExporter
+from azure_monitor.protocol import Data, Envelope, Request
 from azure_monitor.storage import (
     LocalFileBlob,
     LocalFileStorage,
+    _item_priority,
     _now,
     _seconds,
 )
@@ -57,6 +65,30 @@ class TestLocalFileBlob(unittest.TestCase):
         blob.put(test_input)
         self.assertEqual(blob.get(), test_input)
 
+    def test_put_serialized(self):
+        blob = LocalFileBlob(os.path.join(TEST_FOLDER, "foobar.blob"))
+        blob.delete()
+        blob.put((b'{"a": 1}', {"b": 2}))
+        self.assertEqual(blob.get(), ({"a": 1}, {"b": 2}))
+
+    def test_get_raw(self):
+        blob = LocalFileBlob(os.path.join(TEST_FOLDER, "foobar.blob"))
+        blob.delete()
+        self.assertIsNone(blob.get_raw())
+        blob.put((b'{"a": 1}', b'{"b": 2}'))
+        self.assertEqual(blob.get_raw(), (b'{"a": 1}', b'{"b": 2}'))
+
+    def test_iter_raw(self):
+        for name in ("foobar.blob", "foobar.blob.gz"):
+            blob = LocalFileBlob(os.path.join(TEST_FOLDER, name))
+            blob.delete()
+            self.assertEqual(list(blob.iter_raw()), [])
+            blob.put(())
+            self.assertEqual(list(blob.iter_raw()), [])
+            blob.put((b'{"a": 1}', b'{"b": 2}'))
+            self.assertEqual(list(blob.iter_raw()), [b'{"a": 1}', b'{"b": 2}'])
+            blob.delete()
+
     def test_put_with_lease(self):
         blob = LocalFileBlob(os.path.join(TEST_FOLDER, "foobar.blob"))
         test_input = (1, 2, 3)
@@ -65,6 +97,26 @@ class TestLocalFileBlob(unittest.TestCase):
         blob.lease(0.01)
         self.assertEqual(blob.get(), test_input)
 
+    def test_put_compressed(self):
+        blob = LocalFileBlob(os.path.join(TEST_FOLDER, "foobar.blob.gz"))
+        blob.delete()
+        blob.put((b'{"a": 1}', {"b": 2}), lease_period=0.01)
+        with open(blob.fullpath, "rb") as file:
+            self.assertEqual(file.read(2), b"\x1f\x8b")  # gzip magic
+        self.assertEqual(blob.get(), ({"a": 1}, {"b": 2}))
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_lease_locked(self):
+        blob = LocalFileBlob(os.path.join(TEST_FOLDER, "locked.blob"))
+        blob.put((1, 2, 3))
+        self.assertIs(blob.lease(10), blob)
+        other = LocalFileBlob(blob.fullpath)
+        self.assertIsNone(other.lease(10))
+        blob.close()
+        self.assertIs(other.lease(10), other)
+        other.delete()
+        self.assertIsNone(other._lock_file)
+
     def test_lease_error(self):
         blob = LocalFileBlob(os.path.join(TEST_FOLDER, "foobar.blob"))
         blob.delete()
@@ -102,6 +154,7 @@ class TestLocalFileStorage(unittest.TestCase):
             stor.put(test_input)
             self.assertEqual(stor.get().get(), test_input)
         with LocalFileStorage(os.path.join(TEST_FOLDER, "bar")) as stor:
+            self.assertTrue(stor._ready.wait(1))
             self.assertEqual(stor.get().get(), test_input)
             with mock.patch("os.rename", side_effect=throw(Exception)):
                 self.assertIsNone(stor.put(test_input))
@@ -142,12 +195,350 @@ class TestLocalFileStorage(unittest.TestCase):
     def test_check_storage_size_error(self):
         test_input = (1, 2, 3)
         with LocalFileStorage(os.path.join(TEST_FOLDER, "asd5"), 1) as stor:
+            self.assertTrue(stor._ready.wait(1))
             with mock.patch("os.path.getsize", side_effect=throw(OSError)):
                 stor.put(test_input)
                 with mock.patch("os.path.islink") as os_mock:
                     os_mock.return_value = True
                 self.assertTrue(stor._check_storage_size())
 
+    def test_size_accounting(self):
+        test_input = (1, 2, 3)
+        with LocalFileStorage(os.path.join(TEST_FOLDER, "size")) as stor:
+            self.assertEqual(stor._size, 0)
+            with mock.patch("os.walk", side_effect=throw(Exception)):
+                blob = stor.put(test_input)
+                stor.put(test_input)
+            self.assertEqual(stor._size, 12)
+            blob.delete()
+            self.assertEqual(stor._size, 6)
+            stor.get().delete()
+            self.assertEqual(stor._size, 0)
+
+    def test_size_accounting_expiry(self):
+        test_input = (1, 2, 3)
+        with LocalFileStorage(os.path.join(TEST_FOLDER, "size2")) as stor:
+            with mock.patch("azure_monitor.storage._now") as m:
+                m.return_value = _now() - _seconds(30 * 24 * 60 * 60)
+                stor.put(test_input)
+            self.assertEqual(stor._size, 6)
+            self.assertIsNone(stor.get())
+            self.assertEqual(stor._size, 0)
+
+    def test_size_accounting_startup(self):
+        test_input = (1, 2, 3)
+        path = os.path.join(TEST_FOLDER, "size3")
+        with LocalFileStorage(path) as stor:
+            stor.put(test_input)
+        with LocalFileStorage(path) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            self.assertEqual(stor._size, 6)
+            stor._size = 100
+            stor._maintenance_routine()
+            self.assertEqual(stor._size, 6)
+
+    def test_index(self):
+        test_input = (1, 2, 3)
+        path = os.path.join(TEST_FOLDER, "index")
+        with LocalFileStorage(path) as stor:
+            first = stor.put(test_input)
+            second = stor.put(test_input, lease_period=10)
+            with mock.patch("os.listdir", side_effect=throw(Exception)):
+                self.assertEqual(
+                    [blob.fullpath for blob in stor.gets()], [first.fullpath]
+                )
+                first.lease(10)
+                self.assertIsNone(stor.get())
+                second.lease(0.01)
+                first.delete()
+                name = os.path.basename(second.fullpath).split("@")[0]
+                self.assertEqual(stor._names, [name])
+
+    def test_index_external_changes(self):
+        test_input = (1, 2, 3)
+        path = os.path.join(TEST_FOLDER, "index2")
+        with LocalFileStorage(path) as stor:
+            blob = stor.put(test_input)
+            os.remove(blob.fullpath)
+            self.assertIsNone(stor.get())
+            self.assertEqual(stor._names, [])
+            other = LocalFileBlob(os.path.join(path, "external.blob"))
+            other.put(test_input)
+            self.assertIsNone(stor.get())
+            stor._maintenance_routine()
+            self.assertEqual(stor.get().fullpath, other.fullpath)
+
+    def test_compress(self):
+        test_input = ({"name": "test"},) * 100
+        path = os.path.join(TEST_FOLDER, "compress")
+        with LocalFileStorage(path) as stor:
+            stor.put(test_input)
+        with LocalFileStorage(path, compress=True) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            blob = stor.put(test_input)
+            self.assertTrue(blob.fullpath.endswith(".blob.gz"))
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()], [test_input] * 2
+            )
+            sizes = sorted(
+                os.path.getsize(os.path.join(path, name))
+                for name in os.listdir(path)
+            )
+            self.assertLess(sizes[0] * 10, sizes[1])
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_shared_directory(self):
+        path = os.path.join(TEST_FOLDER, "shared")
+        with LocalFileStorage(path) as stor, LocalFileStorage(path) as other:
+            blob = stor.put((1, 2, 3), lease_period=0.01)
+            self.assertIs(blob.lease(0.01), blob)
+            other._maintenance_routine()
+            with mock.patch("azure_monitor.storage._now") as m:
+                m.return_value = _now() + _seconds(1)
+                # lease expired, but the blob is still being sent
+                self.assertIsNone(other.get())
+                blob.close()
+                self.assertEqual(other.get().get(), (1, 2, 3))
+
+    def test_group_commit(self):
+        path = os.path.join(TEST_FOLDER, "group")
+        with LocalFileStorage(path, commit_interval=60) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            first = stor.put((1, 2, 3))
+            second = stor.put((4, 5, 6), lease_period=10)
+            self.assertIs(first, second)
+            self.assertEqual(os.listdir(path), [])
+        self.assertEqual(len(os.listdir(path)), 1)
+        self.assertTrue(first.fullpath.endswith(".lock"))
+        self.assertEqual(first.get(), (1, 2, 3, 4, 5, 6))
+
+    def test_group_commit_size(self):
+        path = os.path.join(TEST_FOLDER, "group2")
+        with LocalFileStorage(path, commit_interval=60, commit_size=8) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            first = stor.put((1, 2))
+            second = stor.put((3, 4))
+            self.assertIs(first, second)
+            self.assertEqual(first.get(), (1, 2, 3, 4))
+            self.assertEqual(stor._size, 8)
+            self.assertIsNot(stor.put((5,)), first)
+            self.assertEqual(len(os.listdir(path)), 1)
+
+    def test_group_unwritten(self):
+        path = os.path.join(TEST_FOLDER, "group4")
+        with LocalFileStorage(path, commit_interval=60, max_size=8) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            blob = stor.put((1, 2))
+            self.assertIsNone(blob.fullpath)
+            self.assertIsNone(blob.get())
+            self.assertIsNone(blob.lease(10))
+            blob.delete()
+            # the gathered batches count toward the storage size
+            self.assertIs(stor.put((3, 4)), blob)
+            self.assertIsNone(stor.put((5, 6)))
+        self.assertEqual(blob.get(), (1, 2, 3, 4))
+
+    def test_group_commit_error(self):
+        path = os.path.join(TEST_FOLDER, "group5")
+        with LocalFileStorage(path, commit_interval=60) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            blob = stor.put((1, 2))
+            stor.put((3,))
+            with mock.patch(
+                "azure_monitor.storage._open_blob", side_effect=throw(OSError)
+            ):
+                with self.assertLogs(storage.logger, "WARNING") as logs:
+                    stor.close()
+        self.assertIn("Failed to write 2 batches", logs.output[0])
+        self.assertIsNone(blob.fullpath)
+
+    def test_group_commit_timeout(self):
+        path = os.path.join(TEST_FOLDER, "group6")
+        with LocalFileStorage(
+            path, commit_interval=60, durability="group", write_timeout=0.01
+        ) as stor:
+            self.assertIsNone(stor.put((1, 2, 3)))
+        self.assertEqual(len(os.listdir(path)), 1)
+
+    def test_group_commit_interval(self):
+        path = os.path.join(TEST_FOLDER, "group3")
+        with LocalFileStorage(
+            path, commit_interval=0.01, durability="group"
+        ) as stor:
+            with mock.patch("azure_monitor.storage._fsync") as fsync:
+                blob = stor.put((1, 2, 3))
+                self.assertEqual(blob.get(), (1, 2, 3))
+            # the blob and the directory
+            self.assertEqual(fsync.call_count, 2)
+
+    def test_durability(self):
+        path = os.path.join(TEST_FOLDER, "durability")
+        for durability, calls in (("none", 0), ("put", 4)):
+            with LocalFileStorage(
+                path, commit_interval=60, durability=durability
+            ) as stor:
+                with mock.patch("azure_monitor.storage._fsync") as fsync:
+                    stor.put((1, 2, 3))
+                    stor.put((4, 5, 6))
+                    stor.close()
+                self.assertEqual(fsync.call_count, calls)
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_exclusive(self):
+        path = os.path.join(TEST_FOLDER, "exclusive")
+        with LocalFileStorage(path, exclusive=True) as stor:
+            self.assertTrue(stor.exclusive)
+            with LocalFileStorage(path, exclusive=True) as other:
+                self.assertFalse(other.exclusive)
+            blob = stor.put((1, 2, 3))
+            fullpath = blob.fullpath
+            first = stor.get()
+            second = stor.get()
+            self.assertIs(first.lease(10), first)
+            self.assertIsNone(second.lease(10))
+            self.assertEqual(first.fullpath, fullpath)
+            self.assertTrue(os.path.exists(fullpath))
+            self.assertIsNone(stor.get())
+            self.assertIs(first.lease(0.01), first)
+            with mock.patch("azure_monitor.storage._now") as m:
+                m.return_value = _now() + _seconds(1)
+                self.assertEqual(stor.get().get(), (1, 2, 3))
+            first.delete()
+            self.assertFalse(os.path.exists(fullpath))
+            self.assertIsNone(stor.get())
+            self.assertEqual(stor._holds, {})
+        with LocalFileStorage(path, exclusive=True) as stor:
+            self.assertTrue(stor.exclusive)
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_exclusive_shared(self):
+        path = os.path.join(TEST_FOLDER, "exclusive_shared")
+        with LocalFileStorage(path, exclusive=True) as stor:
+            with LocalFileStorage(path, exclusive=True) as other:
+                self.assertTrue(other._ready.wait(1))
+                stor.put((1, 2, 3))
+                stor.put((4, 5, 6))
+                owned = list(stor.gets())
+                self.assertIs(owned[0].lease(10), owned[0])
+                # held by the owner, whose lock keeps the other process off
+                other._maintenance_routine()
+                blobs = list(other.gets())
+                self.assertEqual(len(blobs), 2)
+                self.assertIsNone(blobs[0].lease(10))
+                # leased by the other process first, the owner backs off
+                self.assertIs(blobs[1].lease(10), blobs[1])
+                self.assertIsNone(owned[1].lease(10))
+                self.assertEqual(blobs[1].get(), (4, 5, 6))
+                for blob in owned + blobs:
+                    blob.close()
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_tmp_being_written(self):
+        path = os.path.join(TEST_FOLDER, "tmp")
+        with LocalFileStorage(path, write_timeout=0) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            tmp = os.path.join(path, "2000-01-01T000000.000000.blob.tmp")
+            with open(tmp, "wb") as file:
+                storage._try_lock(file)
+                stor._maintenance_routine()
+                self.assertTrue(os.path.exists(tmp))
+            stor._maintenance_routine()
+            self.assertFalse(os.path.exists(tmp))
+
+    def test_evict_oldest(self):
+        with LocalFileStorage(
+            os.path.join(TEST_FOLDER, "evict"),
+            max_size=12,
+            eviction_policy="drop_oldest",
+        ) as stor:
+            stor.put((1, 2, 3), lease_period=10)
+            stor.put((4, 5, 6))
+            stor.put((7, 8, 9))
+            self.assertEqual(stor._size, 12)
+            self.assertEqual(
+                [blob.get() for blob in stor.gets()], [(4, 5, 6), (7, 8, 9)]
+            )
+
+    def test_evict_lowest_priority(self):
+        def envelope(base_type):
+            return {"data": {"baseType": base_type}}
+
+        with LocalFileStorage(
+            os.path.join(TEST_FOLDER, "evict2"),
+            max_size=100,
+            eviction_policy="drop_lowest_priority",
+        ) as stor:
+            stor.put([envelope("RequestData")])
+            stor.put([envelope("MetricData")])
+            stor.put([envelope("MessageData")])
+            stor.put([envelope("MessageData")])
+            stor.put([envelope("MetricData"), envelope("ExceptionData")])
+            self.assertEqual(
+                [blob.get()[-1]["data"]["baseType"] for blob in stor.gets()],
+                ["RequestData", "MessageData", "ExceptionData"],
+            )
+            # nothing less important left to make room for a metric
+            self.assertIsNone(stor.put([envelope("MetricData")]))
+
+    def test_item_priority(self):
+        self.assertEqual(
+            _item_priority(b'{"data": {"baseType": "RequestData"}}'), 3
+        )
+        self.assertEqual(
+            _item_priority(b'{"data":{"baseType":"MetricData"}}'), 0
+        )
+        self.assertEqual(
+            _item_priority(b'{"name": "\\"baseType\\": \\"RequestData"}'), 0
+        )
+        self.assertEqual(
+            _item_priority({"data": {"baseType": "MessageData"}}), 1
+        )
+        self.assertEqual(_item_priority(b'{"data":{"baseType":null}}'), 0)
+        envelope = Envelope(
+            data=Data(
+                base_type="RequestData",
+                base_data=Request(properties={"baseType": "MetricData"}),
+            )
+        ).to_dict()
+        self.assertEqual(_item_priority(envelope), 3)
+        self.assertEqual(_item_priority(serialization.dumps(envelope)), 3)
+        self.assertEqual(_item_priority({"data": None}), 0)
+        self.assertEqual(_item_priority(1), 0)
+
+    def test_maintenance_deferred(self):
+        path = os.path.join(TEST_FOLDER, "deferred")
+        with LocalFileStorage(path) as stor:
+            stor.put((1, 2, 3))
+        scanning = threading.Event()
+        scandir = os.scandir
+
+        def slow_scandir(*args):
+            scanning.wait(1)
+            return scandir(*args)
+
+        with mock.patch("os.scandir", slow_scandir):
+            with LocalFileStorage(path) as stor:
+                # construction does not wait for the first pass
+                self.assertIsNone(stor.get())
+                scanning.set()
+                self.assertTrue(stor._ready.wait(1))
+                self.assertEqual(stor.get().get(), (1, 2, 3))
+                self.assertIsNotNone(stor.maintenance_duration)
+
+    def test_maintenance_incremental(self):
+        path = os.path.join(TEST_FOLDER, "incremental")
+        with LocalFileStorage(path) as stor:
+            for _ in range(3):
+                stor.put((1, 2, 3))
+        with LocalFileStorage(path, maintenance_batch=2) as stor:
+            self.assertTrue(stor._ready.wait(1))
+            self.assertEqual(len(list(stor.gets())), 3)
+            stor._size = 0
+            self.assertFalse(stor._maintenance_routine())
+            stor.put((1, 2, 3))
+            self.assertTrue(stor._maintenance_routine())
+            self.assertEqual(stor._size, 24)
+
     def test_maintanence_routine(self):
         with mock.patch("os.makedirs") as m:
             with LocalFileStorage(os.path.join(TEST_FOLDER, "baz")) as stor:
@@ -163,3 +554,72 @@ class TestLocalFileStorage(unittest.TestCase):
                 stor._maintenance_routine()
             with mock.patch("os.path.isdir", side_effect=throw(Exception)):
                 stor._maintenance_routine()
+
+
+# pylint: disable=protected-access
+class TestLocalFileStorageExporter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ[
+            "APPINSIGHTS_INSTRUMENTATIONKEY"
+        ] = "1234abcd-5678-4efa-8abc-1234567890ab"
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_transmission_exclusive_storage(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+            storage_exclusive=True,
+            max_batch_items=2,
+        )
+        self.addCleanup(exporter.shutdown)
+        for _ in range(3):
+            exporter.storage.put([Envelope().to_dict()])
+        names = sorted(os.listdir(exporter.storage.path))
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(500, "{}")
+            exporter._transmit_from_storage()
+        # two blobs merged in the first request, then backing off
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(sorted(os.listdir(exporter.storage.path)), names)
+        self.assertEqual(len(list(exporter.storage.gets())), 1)
+        exporter._retry.reset()
+        exporter.storage._holds.clear()
+        with mock.patch("requests.Session.post") as post:
+            post.return_value = MockResponse(200, None)
+            exporter._transmit_from_storage()
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(
+            [len(json.loads(call[1]["data"])) for call in post.call_args_list],
+            [2, 1],
+        )
+        self.assertEqual(os.listdir(exporter.storage.path), ["owner"])
+
+    @unittest.skipIf(storage.fcntl is None, "advisory locks not supported")
+    def test_transmission_exclusive_storage_stopped(self):
+        exporter = BaseExporter(
+            storage_path=os.path.join(TEST_FOLDER, self.id()),
+            storage_exclusive=True,
+            max_batch_items=2,
+        )
+        self.addCleanup(exporter.shutdown)
+        for _ in range(3):
+            exporter.storage.put([Envelope().to_dict()])
+        unraisable = []
+        with warnings.catch_warnings(), mock.patch(
+            "sys.unraisablehook", unraisable.append
+        ):
+            warnings.simplefilter("error")
+            with mock.patch("requests.Session.post") as post:
+                post.return_value = MockResponse(503, "{}")
+                exporter._transmit_from_storage()
+            gc.collect()
+        # the blob leased after the first group is given back and closed
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(unraisable, [])
+
+
+class MockResponse:
+    def __init__(self, status_code, text, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
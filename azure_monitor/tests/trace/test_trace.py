@@ -17,7 +17,10 @@ from opentelemetry.trace.status import Status, StatusCanonicalCode
 from azure_monitor.export import ExportResult
 from azure_monitor.export.trace import (
     AzureMonitorSpanExporter,
+    convert_span_to_envelope,
+    dependency_cache_info,
     indicate_processed_by_metric_extractors,
+    set_dependency_cache_size,
 )
 from azure_monitor.options import ExporterOptions
 
@@ -42,6 +45,23 @@ def throw(exc_type, *args, **kwargs):
     return func
 
 
+def convert_client_span(attributes):
+    """Converts a client span with the given attributes, returns its data."""
+    span = Span(
+        name="test",
+        context=SpanContext(
+            trace_id=36873507687745823477771305566750195431,
+            span_id=12030755672171557337,
+            is_remote=False,
+        ),
+        attributes=attributes,
+        kind=SpanKind.CLIENT,
+    )
+    span.start()
+    span.end()
+    return convert_span_to_envelope(span).data.base_data
+
+
 # pylint: disable=import-error
 # pylint: disable=protected-access
 # pylint: disable=too-many-lines
@@ -182,6 +202,56 @@ class TestAzureExporter(unittest.TestCase):
             result = exporter.export([test_span])
             self.assertEqual(result, SpanExportResult.FAILURE)
 
+    def test_span_to_envelope_conventions(self):
+        data = convert_client_span(
+            {
+                "db.system": "postgresql",
+                "db.name": "orders",
+                "db.statement": "SELECT 1",
+            }
+        )
+        self.assertEqual(data.type, "postgresql")
+        self.assertEqual(data.target, "orders")
+        self.assertEqual(data.data, "SELECT 1")
+        self.assertEqual(data.properties["db.name"], "orders")
+        data = convert_client_span(
+            {"messaging.system": "kafka", "messaging.destination": "orders"}
+        )
+        self.assertEqual(data.type, "kafka")
+        self.assertEqual(data.target, "orders")
+        data = convert_client_span(
+            {
+                "rpc.system": "grpc",
+                "rpc.service": "Orders",
+                "rpc.method": "Get",
+                "net.peer.name": "orders.local",
+                "net.peer.port": 50051,
+            }
+        )
+        self.assertEqual(data.type, "grpc")
+        self.assertEqual(data.target, "orders.local:50051")
+        self.assertEqual(data.name, "Orders/Get")
+
+    def test_dependency_cache(self):
+        self.addCleanup(set_dependency_cache_size, 1024)
+        set_dependency_cache_size(1)
+        data = convert_client_span(
+            {"http.method": "GET", "http.url": "https://example.com/a"}
+        )
+        self.assertEqual(data.target, "example.com")
+        self.assertEqual(data.name, "GET//a")
+        data = convert_client_span(
+            {"http.method": "GET", "http.url": "https://example.com/a"}
+        )
+        self.assertEqual(data.name, "GET//a")
+        data = convert_client_span(
+            {"http.method": "POST", "http.url": "https://example.com/a"}
+        )
+        self.assertEqual(data.name, "POST//a")
+        info = dependency_cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+        self.assertEqual((info.maxsize, info.currsize), (1, 1))
+
     def test_indicate_processed_by_metric_extractors(self):
         envelope = mock.Mock()
         envelope.data.base_type = "RemoteDependencyData"